@@ -0,0 +1,249 @@
+"""Timing benchmarks for the simulation, the renderer, RBM training and name generation."""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SIZES = [20, 200, 2_000, 20_000]
+RENDER_TARGET = 5_000  # agents the renderer should draw at 30-60 FPS, always benchmarked
+SPAWN_SIZES = [1_000, 1_000_000]  # populations a single spawn is timed at; its cost must not grow with them
+SPAWN_GROWTH = 10  # largest tolerated ratio between the spawn times at the two sizes
+RBM_GRID = [(6, 3), (64, 32), (784, 256)]
+RBM_BATCHES = [100, 1_000]
+RBM_STEPS = [1, 5]
+GROUPS = ["simulation", "render", "rbm", "names"]
+
+
+def measure(run, setup=None, repeat=5, min_time=0.05, number=None):
+    """
+    Time `run`, calling `setup` before each repeat and passing its result to `run`.
+    :param run: Callable taking the setup result
+    :param setup: Callable preparing a fresh state (default: no state)
+    :param repeat: Number of timed repeats
+    :param min_time: Choose the calls per repeat so that a repeat lasts at least this long
+    :param number: Calls per repeat (default: calibrated from min_time)
+    :return: Dict with the best and median seconds per call
+    """
+    if setup is None:
+        setup = lambda: None
+    if number is None:
+        number = 1
+        while True:
+            state = setup()
+            start = time.perf_counter()
+            for _ in range(number):
+                run(state)
+            if time.perf_counter() - start >= min_time or number >= 1 << 20:
+                break
+            number *= 4
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            run(state)
+        times.append((time.perf_counter() - start) / number)
+    return {"best": min(times), "median": statistics.median(times), "number": number, "repeat": repeat}
+
+
+def machine_info():
+    """Describe the machine and the code version a benchmark ran on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__) or "."
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "commit": commit,
+    }
+
+
+def bench_simulation(sizes, repeat):
+    from simulation import Agent, random_graph
+
+    results = {}
+    for n in sizes:
+        graph_for = lambda: random_graph(n, seed=0)
+        results[f"add_agent[n={n}]"] = measure(lambda graph: graph.add_agent(Agent("Bench")), graph_for, repeat)
+        results[f"spawn_despawn_100[n={n}]"] = measure(lambda graph: graph.despawn(graph.spawn(100)), graph_for, repeat)
+        results[f"do_steps[n={n}]"] = measure(lambda graph: graph.do_steps(), graph_for, repeat)
+        results[f"do_trades[n={n}]"] = measure(lambda graph: graph.do_trades(), graph_for, repeat)
+        results[f"update[n={n}]"] = measure(lambda graph: graph.update(), graph_for, repeat)
+        results[f"check_for_winner[n={n}]"] = measure(lambda graph: graph.check_for_winner(), graph_for, repeat)
+    for n in SPAWN_SIZES:
+        graph = random_graph(n, seed=0)
+        results[f"spawn_despawn_1[n={n}]"] = measure(lambda _: graph.despawn(graph.spawn(1)), repeat=repeat)
+    small, large = (results[f"spawn_despawn_1[n={n}]"]["best"] for n in SPAWN_SIZES)
+    if large > SPAWN_GROWTH * small:
+        raise RuntimeError(
+            f"spawn_despawn_1 takes {format_seconds(large).strip()} at n={SPAWN_SIZES[-1]}"
+            f" but {format_seconds(small).strip()} at n={SPAWN_SIZES[0]}"
+        )
+    return results
+
+
+def bench_render(sizes, repeat):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from simulation import random_graph
+    from trading_game import App
+
+    app = App()
+    results = {}
+    for n in sorted(set(sizes) | {RENDER_TARGET}):
+        graph = random_graph(n, seed=0)
+        graph.update()
+
+        def fresh():
+            # start each repeat from an empty label cache and a full redraw
+            app.renderer.labels.surfaces.clear()
+            app.renderer.previous = None
+            return graph
+
+        results[f"draw_graph[n={n}]"] = measure(app.draw_graph, fresh, repeat)
+    return results
+
+
+def bench_rbm(repeat, grid=RBM_GRID, batches=RBM_BATCHES, steps=RBM_STEPS):
+    from models import RestrictedBoltzmannMachine
+
+    results = {}
+    rng = np.random.default_rng(0)
+    for n_visible, n_hidden in grid:
+        rbm = RestrictedBoltzmannMachine(n_visible, n_hidden, seed=0)
+        for batch_size in batches:
+            data = (rng.random((batch_size, n_visible)) < 0.3).astype(np.uint8)
+            for k in steps:
+                name = f"contrastive_divergence[v={n_visible},h={n_hidden},batch={batch_size},k={k}]"
+                results[name] = measure(lambda _: rbm.contrastive_divergence(data, k), repeat=repeat)
+    return results
+
+
+def bench_names(repeat):
+    import random
+
+    from names import generate_names, generate_random_name
+
+    rng = random.Random(0)
+    results = {"generate_random_name": measure(lambda _: generate_random_name(3, rng=rng), repeat=repeat)}
+    for n in (100_000, 1_000_000):
+        results[f"generate_names[n={n}]"] = measure(lambda _: generate_names(n, 3, rng=0), repeat=repeat)
+        results[f"generate_names[n={n},unique]"] = measure(lambda _: generate_names(n, 3, rng=0, unique=True), repeat=repeat)
+    # the syllable counts random_graph uses; short names run out and have to be redrawn
+    results["generate_names[n=1000000,sylb=1-3,unique]"] = measure(
+        lambda _: generate_names(1_000_000, (1, 2, 3), rng=0, unique=True), repeat=repeat
+    )
+    # mostly one syllable: duplicates keep turning up across many redraw rounds
+    mixed = (1,) * 30 + (2,)
+    for seed in range(300):
+        names = generate_names(200, mixed, rng=seed, unique=True)
+        if len(set(names)) != len(names):
+            raise RuntimeError(f"generate_names(unique=True) repeated names with seed {seed}")
+    results["generate_names[n=200,sylb=1x30+2,unique]"] = measure(
+        lambda _: generate_names(200, mixed, rng=0, unique=True), repeat=repeat
+    )
+    return results
+
+
+def run_benchmarks(groups=GROUPS, sizes=SIZES, repeat=5, verbose=False):
+    """
+    Run the selected benchmark groups.
+    :param groups: Subset of GROUPS
+    :param sizes: Agent counts for the simulation and render benchmarks
+    :param repeat: Timed repeats per benchmark
+    :return: Dict with "machine" metadata and "results" mapping benchmark names to timings
+    """
+    runners = {
+        "simulation": lambda: bench_simulation(sizes, repeat),
+        "render": lambda: bench_render(sizes, repeat),
+        "rbm": lambda: bench_rbm(repeat),
+        "names": lambda: bench_names(repeat),
+    }
+    results = {}
+    for group in groups:
+        for name, timing in runners[group]().items():
+            results[name] = timing
+            if verbose:
+                print(f"{name:70s} {format_seconds(timing['best'])}")
+    return {"machine": machine_info(), "results": results}
+
+
+def format_seconds(seconds):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Compare two benchmark result dicts by their best times.
+    :param threshold: Relative slowdown above which a benchmark counts as a regression
+    :return: List of (name, baseline seconds, current seconds, ratio, regressed) for the shared benchmarks
+    """
+    rows = []
+    for name, timing in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["best"], timing["best"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def print_comparison(rows):
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:70s} {format_seconds(before)} -> {format_seconds(after)}  x{ratio:5.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--out", default="benchmarks.json", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="compare against this stored result file")
+    parser.add_argument("--compare", default=None, help="compare this result file with --baseline instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown flagged as a regression")
+    parser.add_argument("--groups", default=",".join(GROUPS), help="comma-separated subset of " + ",".join(GROUPS))
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated agent counts")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repeats per benchmark")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            current = json.load(f)
+    else:
+        groups = [g for g in args.groups.split(",") if g]
+        unknown = set(groups) - set(GROUPS)
+        if unknown:
+            parser.error(f"unknown benchmark groups: {sorted(unknown)}")
+        sizes = [int(s) for s in args.sizes.split(",")]
+        current = run_benchmarks(groups, sizes, args.repeat, verbose=True)
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"results written to {args.out}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.threshold)
+        print_comparison(rows)
+        if any(regressed for *_, regressed in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
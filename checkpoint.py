@@ -0,0 +1,284 @@
+"""Checkpoints of the full simulation state, and recorded runs that can be replayed."""
+
+import json
+import os
+import random
+from dataclasses import asdict
+
+import numpy as np
+
+from simulation import AgentGraph, SimConfig
+from world import Trades
+
+CHECKPOINT_VERSION = 2
+SPAWNED_FIELDS = ("color", "want", "steprate", "stepsize", "turn_variance")  # kept for agents spawned while recording
+
+
+def _rng_from_state(state):
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def save_checkpoint(graph, path):
+    """
+    Write the whole world to the directory `path`.
+
+    Every per-agent field is stored as its own .npy file so it can be memory-mapped back;
+    the scalars, the RNG states and the tick counter go into meta.json.
+    """
+    os.makedirs(path, exist_ok=True)
+    world = graph.world
+    for field, array in world.arrays().items():
+        np.save(os.path.join(path, field + ".npy"), array)
+    np.save(os.path.join(path, "names.npy"), np.array(world.names, dtype=str))
+    np.save(os.path.join(path, "pairs.npy"), np.stack(graph.pairs))
+    if graph.trades is not None:
+        np.savez(os.path.join(path, "trades.npz"), **graph.trades._asdict())
+
+    np_state = np.random.get_state()
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "tick": graph.tick,
+        "config": asdict(graph.config),
+        "trade_distance": graph.trade_distance,
+        "world": {
+            "width": world.width,
+            "height": world.height,
+            "torus": world.torus,
+            "n_resources": world.n_resources,
+            "noise_key": world.noise_key,
+        },
+        "rng": world.rng.bit_generator.state,
+        # agent construction still uses the global generators
+        "random": random.getstate(),
+        "np_random": [np_state[0], np_state[1].tolist(), *np_state[2:]],
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_checkpoint(path, mmap=False, restore_globals=True):
+    """
+    Rebuild an AgentGraph from a checkpoint directory.
+    :param path: Directory written by save_checkpoint
+    :param mmap: Memory-map the agent arrays (copy-on-write) instead of reading them
+    :param restore_globals: Also restore the `random` and `np.random` global states
+    :return: AgentGraph that continues exactly where the saved one stopped
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["version"] not in (1, CHECKPOINT_VERSION):
+        raise ValueError(f"unsupported checkpoint version {meta['version']}")
+
+    graph = AgentGraph(config=SimConfig(**meta["config"]))
+    world = graph.world
+    for key, value in meta["world"].items():
+        setattr(world, key, value)
+    mmap_mode = "c" if mmap else None
+    names = np.load(os.path.join(path, "names.npy")).tolist()
+    arrays = {}
+    for field in world.arrays():
+        filename = os.path.join(path, field + ".npy")
+        if field in ("alive", "uid") and meta["version"] == 1:
+            # version 1 had no dead slots and no uids
+            arrays[field] = np.ones(len(names), dtype=bool) if field == "alive" else np.arange(len(names))
+        else:
+            arrays[field] = np.load(filename, mmap_mode=mmap_mode)
+    world.load_arrays(names, arrays)
+    world.rng = _rng_from_state(meta["rng"])
+
+    graph.tick = meta["tick"]
+    graph.trade_distance = meta["trade_distance"]
+    i, j = np.load(os.path.join(path, "pairs.npy"))
+    graph.pairs = (i, j)
+    trades_path = os.path.join(path, "trades.npz")
+    if os.path.exists(trades_path):
+        with np.load(trades_path) as trades:
+            graph.trades = Trades(**{k: trades[k] for k in Trades._fields})
+
+    if restore_globals:
+        version, internal, gauss = meta["random"]
+        random.setstate((version, tuple(internal), gauss))
+        name, keys, *rest = meta["np_random"]
+        np.random.set_state((name, np.array(keys, dtype=np.uint32), *rest))
+    return graph
+
+
+class FrameRecorder:
+    """
+    Record the per-tick state needed to redraw a run.
+
+    A checkpoint of the starting state is written to `path`, then every captured tick
+    appends positions, resources, trade partners, the alive mask, the uids and the pairs
+    that traded to flat binary files that a Replay memory-maps back. The population may
+    change between ticks: frames_end.bin holds where each frame's rows end, and agents
+    spawned after the checkpoint get their name and SPAWNED_FIELDS appended to the agents_*
+    files in uid order. The individual transfers are left to trade_log.
+    """
+
+    def __init__(self, graph, path):
+        save_checkpoint(graph, path)
+        self.path = path
+        self.next_uid = graph.world.next_uid  # agents from this uid on are not in the checkpoint
+        self.files = {
+            name: open(os.path.join(path, f"frames_{name}.bin"), "wb")
+            for name in ("loc", "resources", "trading_with", "alive", "uid", "end", "traded", "traded_end")
+        }
+        self.agent_files = {field: open(os.path.join(path, f"agents_{field}.bin"), "wb") for field in SPAWNED_FIELDS}
+        self.agent_names = open(os.path.join(path, "agents_names.txt"), "w", encoding="utf-8")
+        self.frames = 0
+        self.rows = 0  # agent rows written so far
+        self.traded = 0  # pairs written so far
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def capture(self, graph):
+        world = graph.world
+        if world.next_uid > self.next_uid:
+            self._capture_spawned(world)
+        files = self.files
+        files["loc"].write(world.loc.astype(np.float32).tobytes())
+        files["resources"].write(world.resources.astype(np.int32).tobytes())
+        files["trading_with"].write(world.trading_with.astype(np.int32).tobytes())
+        files["alive"].write(world.alive.tobytes())
+        files["uid"].write(world.uid.tobytes())
+        self.rows += len(world)
+        files["end"].write(np.int64(self.rows).tobytes())
+        if graph.trades is not None:
+            files["traded"].write(np.stack((graph.trades.i, graph.trades.j), axis=1).astype(np.int32).tobytes())
+            self.traded += len(graph.trades.i)
+        # where the pairs of this frame end in frames_traded.bin
+        files["traded_end"].write(np.int64(self.traded).tobytes())
+        self.frames += 1
+
+    def _capture_spawned(self, world):
+        """Append the names and fixed fields of the agents spawned since the last frame."""
+        slots = world.slot_of(np.arange(self.next_uid, world.next_uid))
+        # agents despawned again before this frame never show up, so any values do for them
+        live = slots >= 0
+        names = world.names
+        self.agent_names.writelines(names[slot] + "\n" if slot >= 0 else "\n" for slot in slots.tolist())
+        for field, f in self.agent_files.items():
+            dtype, shape, fill = world.FIELDS[field]
+            values = np.full(slots.shape + shape, fill, dtype=dtype)
+            values[live] = getattr(world, field)[slots[live]]
+            f.write(values.tobytes())
+        self.next_uid = world.next_uid
+
+    def close(self):
+        for f in (*self.files.values(), *self.agent_files.values(), self.agent_names):
+            f.close()
+
+
+class Replay:
+    """Read-only view of a run recorded by FrameRecorder."""
+
+    def __init__(self, path):
+        self.graph = load_checkpoint(path, restore_globals=False)
+        self.start_tick = self.graph.tick
+        world = self.graph.world
+        self.loc = self._map(path, "frames_loc.bin", np.float32, (2,))
+        self.resources = self._map(path, "frames_resources.bin", np.int32, (world.n_resources,))
+        self.trading_with = self._map(path, "frames_trading_with.bin", np.int32, ())
+        if os.path.exists(os.path.join(path, "frames_end.bin")):
+            self.frame_end = self._map(path, "frames_end.bin", np.int64, ())
+            self.alive = self._map(path, "frames_alive.bin", np.bool_, ())
+            self.uid = self._map(path, "frames_uid.bin", np.int64, ())
+            self._load_agents(path)
+        else:
+            # recorded before populations could change: every frame holds the starting agents
+            n = len(world)
+            self.frame_end = n * np.arange(1, (len(self.loc) // n if n else 0) + 1)
+            self.alive = self.uid = None
+        if os.path.exists(os.path.join(path, "frames_traded_end.bin")):
+            self.traded = self._map(path, "frames_traded.bin", np.int32, (2,))
+            self.traded_end = self._map(path, "frames_traded_end.bin", np.int64, ())
+            if len(self.traded_end) != len(self):
+                raise ValueError(f"{len(self.traded_end)} traded-pair offsets for {len(self)} frames")
+        else:
+            # recorded before the traded pairs were kept
+            self.traded = self.traded_end = None
+
+    @staticmethod
+    def _map(path, name, dtype, shape):
+        filename = os.path.join(path, name)
+        row = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        frames = os.path.getsize(filename) // row if row else 0
+        if frames == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode="r", shape=(frames,) + shape)
+
+    def _load_agents(self, path):
+        """Index the names and SPAWNED_FIELDS of every agent by uid: the checkpoint's, then the spawned ones."""
+        world = self.graph.world
+        uid = world.uid
+        self.agent_names = [""] * world.next_uid
+        for name, agent in zip(world.names, uid.tolist()):
+            self.agent_names[agent] = name
+        with open(os.path.join(path, "agents_names.txt"), encoding="utf-8") as f:
+            self.agent_names.extend(f.read().splitlines())
+        self.agent_fields = {}
+        for field in SPAWNED_FIELDS:
+            dtype, shape, fill = world.FIELDS[field]
+            start = np.full((world.next_uid,) + shape, fill, dtype=dtype)
+            start[uid] = getattr(world, field)
+            spawned = self._map(path, f"agents_{field}.bin", dtype, shape)
+            self.agent_fields[field] = np.concatenate((start, spawned))
+
+    def __len__(self):
+        return len(self.frame_end)
+
+    def _rows(self, frame):
+        """Slice of the agent rows of frame `frame`."""
+        if not 0 <= frame < len(self):
+            raise IndexError(f"frame {frame} out of range for {len(self)} frames")
+        return slice(self.frame_end[frame - 1] if frame > 0 else 0, self.frame_end[frame])
+
+    def trades_at(self, frame):
+        """
+        Trades with the pairs that traded during frame `frame`, enough to highlight them; the
+        transfer fields are empty. None for recordings without them.
+        """
+        if self.traded is None:
+            return None
+        if not 0 <= frame < len(self):
+            raise IndexError(f"frame {frame} out of range for {len(self)} frames")
+        start = self.traded_end[frame - 1] if frame > 0 else 0
+        pairs = np.asarray(self.traded[start : self.traded_end[frame]], dtype=np.int64)
+        empty = np.empty(0, dtype=np.int64)
+        return Trades(pairs[:, 0], pairs[:, 1], empty, empty, empty, empty)
+
+    def _load_population(self, uid, alive):
+        """Replace the world's agents with those of a frame whose population differs from the loaded one."""
+        world = self.graph.world
+        arrays = {field: np.zeros((len(uid),) + array.shape[1:], dtype=array.dtype) for field, array in world.arrays().items()}
+        for field, values in self.agent_fields.items():
+            arrays[field][...] = values[uid]
+        arrays["alive"][...] = alive
+        arrays["uid"][...] = uid
+        names = self.agent_names
+        world.load_arrays([names[agent] for agent in uid.tolist()], arrays)
+
+    def graph_at(self, frame):
+        """Load frame `frame` into self.graph and return it, ready to be drawn."""
+        graph = self.graph
+        world = graph.world
+        rows = self._rows(frame)
+        if self.uid is not None:
+            uid, alive = np.asarray(self.uid[rows]), np.asarray(self.alive[rows])
+            if not (np.array_equal(uid, world.uid) and np.array_equal(alive, world.alive)):
+                self._load_population(uid, alive)
+        world.loc[:] = self.loc[rows]
+        world.resources[:] = self.resources[rows]
+        world.trading_with[:] = self.trading_with[rows]
+        world.resources_changed()
+        graph.tick = self.start_tick + frame + 1
+        graph.trades = self.trades_at(frame)
+        i, j, _ = graph.find_pairs()
+        graph.pairs = (i, j)
+        return graph
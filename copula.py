@@ -0,0 +1,98 @@
+"""Correlated binary data from a Gaussian copula, generated in chunks with a factorization computed once."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from rbm_data import PackedWriter, packed_width
+
+
+class CopulaSampler:
+    """
+    Draw binary vectors by thresholding correlated Gaussians.
+
+    The covariance is factored once as L L^T: by Cholesky when it is positive definite and
+    otherwise from its eigendecomposition, keeping only the significant components, so a
+    low-rank covariance needs only `rank` normals per row. Rows are generated in chunks of
+    `chunk_rows`, chunk i from the i-th stream spawned from the seed, so the output depends on
+    the seed and the chunk size but not on how many threads produced it.
+    """
+
+    def __init__(self, covariance, thresholds=None, dtype=np.float64, tol=1e-10):
+        """
+        :param covariance: Covariance matrix (n_features x n_features), possibly singular
+        :param thresholds: A feature is 1 where its Gaussian exceeds the threshold (default: 0)
+        :param dtype: Floating point type of the Gaussian draws
+        :param tol: Eigenvalues below tol * largest eigenvalue are treated as zero
+        """
+        covariance = np.asarray(covariance, dtype=np.float64)
+        self.n_features = len(covariance)
+        self.dtype = np.dtype(dtype)
+        try:
+            factor = np.linalg.cholesky(covariance)
+            self.method = "cholesky"
+        except np.linalg.LinAlgError:
+            values, vectors = np.linalg.eigh(covariance)
+            keep = values > tol * max(values.max(), 0)
+            factor = vectors[:, keep] * np.sqrt(values[keep])
+            self.method = "eigen"
+        self.factor = np.ascontiguousarray(factor.T, dtype=self.dtype)  # rank x n_features
+        self.thresholds = np.zeros(self.n_features, dtype=self.dtype) if thresholds is None else np.asarray(thresholds, dtype=self.dtype)
+
+    @property
+    def rank(self):
+        return len(self.factor)
+
+    def _chunk(self, seed, n_rows, packed):
+        rng = np.random.default_rng(seed)
+        gaussian = rng.standard_normal((n_rows, self.rank), dtype=self.dtype) @ self.factor
+        bits = gaussian > self.thresholds
+        return np.packbits(bits, axis=1) if packed else bits.view(np.uint8)
+
+    def chunks(self, n_samples, seed=None, chunk_rows=1 << 16, packed=False, workers=1):
+        """
+        Yield the samples chunk by chunk, in order.
+        :param n_samples: Total number of rows
+        :param seed: Root seed, an int or SeedSequence (default: fresh entropy)
+        :param chunk_rows: Rows per chunk
+        :param packed: Yield np.packbits(axis=1) rows instead of uint8 0/1 rows
+        :param workers: Threads generating chunks concurrently (numpy releases the GIL for the heavy parts)
+        """
+        root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        sizes = [min(chunk_rows, n_samples - start) for start in range(0, n_samples, chunk_rows)]
+        seeds = root.spawn(len(sizes))
+        if workers <= 1:
+            for chunk_seed, size in zip(seeds, sizes):
+                yield self._chunk(chunk_seed, size, packed)
+            return
+        with ThreadPoolExecutor(workers) as pool:
+            # keep a bounded number of chunks in flight
+            pending = []
+            for chunk_seed, size in zip(seeds, sizes):
+                pending.append(pool.submit(self._chunk, chunk_seed, size, packed))
+                if len(pending) > 2 * workers:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+
+    def sample(self, n_samples, seed=None, packed=False, out=None, chunk_rows=1 << 16, workers=1):
+        """
+        Generate n_samples rows into one array.
+        :param out: Optional preallocated uint8 array of shape (n_samples, n_features),
+            or (n_samples, packed_width(n_features)) with packed=True
+        :return: uint8 array of 0/1 values, or bit-packed rows with packed=True
+        """
+        width = packed_width(self.n_features) if packed else self.n_features
+        if out is None:
+            out = np.empty((n_samples, width), dtype=np.uint8)
+        start = 0
+        for chunk in self.chunks(n_samples, seed, chunk_rows, packed, workers):
+            out[start : start + len(chunk)] = chunk
+            start += len(chunk)
+        return out
+
+    def write(self, path, n_samples, seed=None, chunk_rows=1 << 16, workers=1):
+        """Write n_samples rows to a bit-packed file readable by rbm_data.PackedDataset."""
+        with PackedWriter(path, self.n_features) as writer:
+            for chunk in self.chunks(n_samples, seed, chunk_rows, True, workers):
+                writer.write(chunk, packed=True)
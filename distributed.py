@@ -0,0 +1,345 @@
+"""Multi-process trading game: the torus split into vertical strips, one worker process per strip."""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from simulation import TRADE_UNITS, SimConfig, random_graph
+from spatial import SpatialGrid
+from world import World
+
+
+def _strip_of(x, strip_width, n_strips):
+    return np.minimum((x // strip_width).astype(np.int64), n_strips - 1)
+
+
+class _Strip:
+    """State of one worker: the ids of the agents it owns and its neighbors' queues."""
+
+    def __init__(self, index, meta, arrays, queues, barrier, owned):
+        self.index = index
+        self.meta = meta
+        self.arrays = arrays
+        self.barrier = barrier
+        self.owned = owned
+        n = meta["n_strips"]
+        self.lo = index * meta["strip_width"]
+        self.hi = meta["width"] if index == n - 1 else (index + 1) * meta["strip_width"]
+        wrap = meta["torus"] and n > 1
+        self.left = (index - 1) % n if index > 0 or wrap else None
+        self.right = (index + 1) % n if index < n - 1 or wrap else None
+        to_left, to_right = queues
+        # to_left[i] carries messages from strip i to its left neighbor, to_right[i] to its right one
+        self.send_left = to_left[index] if self.left is not None else None
+        self.send_right = to_right[index] if self.right is not None else None
+        self.recv_left = to_right[self.left] if self.left is not None else None
+        self.recv_right = to_left[self.right] if self.right is not None else None
+        self.world = World(meta["width"], meta["height"], torus=meta["torus"], n_resources=meta["n_resources"])
+        self.world.noise_key = meta["noise_key"]
+
+    def _load(self, ids):
+        """Copy the rows of `ids` into the local world, in id order."""
+        self.world.load_arrays([""] * len(ids), {field: array[ids] for field, array in self.arrays.items()})
+
+    def _exchange(self, to_left, to_right):
+        """Send an id list to each neighbor and return what the neighbors sent back."""
+        if self.send_left is not None:
+            self.send_left.put(to_left)
+        if self.send_right is not None:
+            self.send_right.put(to_right)
+        received = [q.get() for q in (self.recv_left, self.recv_right) if q is not None]
+        return np.concatenate(received) if received else np.empty(0, dtype=np.int64)
+
+    def _migrate(self):
+        """Hand the owned agents that left the strip over to the neighbors and take theirs in."""
+        owned = self.owned
+        strip = _strip_of(self.arrays["loc"][owned, 0], self.meta["strip_width"], self.meta["n_strips"])
+        leaving = strip != self.index
+        if np.any(leaving & (strip != self.left) & (strip != self.right)):
+            raise RuntimeError("an agent moved further than one strip in a single tick")
+        to_left = owned[leaving & (strip == self.left)]
+        to_right = owned[leaving & (strip == self.right) & (strip != self.left)]
+        self.owned = np.sort(np.concatenate((owned[~leaving], self._exchange(to_left, to_right))))
+
+    def tick(self, tick):
+        """Advance the owned agents by one tick. Returns the number of transfers they gave."""
+        arrays, world = self.arrays, self.world
+        halo_width = 2 * self.meta["trade_distance"]
+
+        # random walk of the owned agents; their new positions are visible to the neighbors
+        self._load(self.owned)
+        world.step(tick, ids=self.owned)
+        arrays["loc"][self.owned] = world.loc
+        arrays["bearing"][self.owned] = world.bearing
+
+        # migrate before picking the halo: then every owned agent lies inside [lo, hi), also
+        # after crossing the torus seam, and the strip edges bound the distances to it
+        self._migrate()
+        owned = self.owned
+
+        # everything within two trade distances of an owned agent affects its trades
+        x = arrays["loc"][owned, 0]
+        halo = self._exchange(owned[x - self.lo < halo_width], owned[self.hi - x <= halo_width])
+        local = np.union1d(owned, halo)
+        self._load(local)
+        i, j, dist = SpatialGrid(world.width, world.height, self.meta["trade_distance"], world.torus).build(world.loc).pairs(
+            self.meta["trade_distance"]
+        )
+        trades = world.trade(i, j, dist, units=self.meta["units"])
+
+        # nobody may write before every strip has read the rows it needs
+        self.barrier.wait()
+        rows = np.searchsorted(local, owned)
+        arrays["loc"][owned] = world.loc[rows]
+        arrays["resources"][owned] = world.resources[rows]
+        partner = world.trading_with[rows]
+        arrays["trading_with"][owned] = np.where(partner >= 0, local[partner], -1)
+        return int(np.isin(local[trades.giver], owned).sum())
+
+
+def _worker(index, meta, names, queues, barrier, commands, owned):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names.values()]
+    try:
+        arrays = {
+            field: np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            for (field, (dtype, shape)), block in zip(meta["fields"].items(), blocks)
+        }
+        strip = _Strip(index, meta, arrays, queues, barrier, owned)
+        while True:
+            message = commands.recv()
+            if message is None:
+                break
+            start, n_ticks = message
+            try:
+                transfers = sum(strip.tick(tick) for tick in range(start, start + n_ticks))
+                commands.send(("ok", transfers, len(strip.owned)))
+            except Exception:
+                barrier.abort()
+                commands.send(("error", traceback.format_exc(), 0))
+                break
+        del arrays, strip
+    finally:
+        for block in blocks:
+            block.close()
+
+
+class DistributedEngine:
+    """
+    Run an AgentGraph's world across worker processes, one vertical strip of the world each.
+
+    All per-agent arrays live in shared memory, indexed by agent id (the slot in the original
+    world). Every tick each worker steps the agents it owns, passes on the ones that crossed
+    into a neighboring strip, receives from its two neighbors the ids of their agents within
+    two trade distances of the common border, resolves the trades of its agents together with
+    that halo using the ordinary World.trade and writes back only its own agents.
+
+    The random walk uses counter noise (see World.use_counter_noise), and every agent's trades
+    are computed from exactly the agents that influence them, so the result is bit-for-bit the
+    same as a single-process AgentGraph with the same noise key, on a torus or not, as long as
+    no agent moves further than one strip in a tick (such a tick raises instead). equivalence()
+    checks a given configuration.
+    """
+
+    def __init__(self, graph, workers=None, start_method="spawn"):
+        """
+        :param graph: AgentGraph with the starting state; counter noise is switched on if needed
+        :param workers: Number of strips and processes (default: os.cpu_count(), as many as fit)
+        :param start_method: multiprocessing start method for the workers
+        """
+        world = graph.world
+        if world.noise_key is None:
+            world.use_counter_noise()
+        halo_width = 2 * graph.trade_distance
+        max_strips = max(1, int(world.width // halo_width))
+        if workers is None:
+            workers = min(os.cpu_count(), max_strips)
+        elif workers > max_strips:
+            raise ValueError(f"strips must be at least {halo_width} wide, so at most {max_strips} workers fit")
+        self.graph = graph
+        self.workers = workers
+        self.tick = graph.tick
+
+        fields = {field: (array.dtype, array.shape) for field, array in world.arrays().items()}
+        self._blocks = {}
+        self.arrays = {}
+        for field, array in world.arrays().items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._blocks[field] = block
+            self.arrays[field] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            self.arrays[field][...] = array
+        meta = {
+            "fields": fields,
+            "width": world.width,
+            "height": world.height,
+            "torus": world.torus,
+            "n_resources": world.n_resources,
+            "noise_key": world.noise_key,
+            "trade_distance": graph.trade_distance,
+            "units": TRADE_UNITS,
+            "n_strips": workers,
+            "strip_width": world.width / workers,
+        }
+
+        context = multiprocessing.get_context(start_method)
+        # kept on self: the workers unpickle them after this method returns
+        self._queues = queues = ([context.Queue() for _ in range(workers)], [context.Queue() for _ in range(workers)])
+        self._barrier = barrier = context.Barrier(workers)
+        strip = _strip_of(world.loc[:, 0], meta["strip_width"], workers)
+        names = {field: block.name for field, block in self._blocks.items()}
+        self._connections, self._processes = [], []
+        for index in range(workers):
+            parent, child = context.Pipe()
+            owned = np.flatnonzero((strip == index) & world.alive)
+            process = context.Process(target=_worker, args=(index, meta, names, queues, barrier, child, owned), daemon=True)
+            process.start()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, n_ticks):
+        """
+        Advance all strips by n_ticks.
+        :return: Number of transfers made during these ticks
+        """
+        for index, conn in enumerate(self._connections):
+            try:
+                conn.send((self.tick, n_ticks))
+            except OSError as error:  # BrokenPipeError once the worker is gone
+                self.close(force=True)
+                raise RuntimeError(f"distributed worker of strip {index} died") from error
+        replies = {}
+        while len(replies) < self.workers:
+            for conn in connection.wait([c for c in self._connections if c not in replies]):
+                try:
+                    status, value, _ = replies[conn] = conn.recv()
+                except (EOFError, OSError):
+                    status, value = "error", "worker process died"
+                if status == "error":
+                    index = self._connections.index(conn)
+                    self.close(force=True)
+                    raise RuntimeError(f"distributed worker of strip {index} failed:\n" + value)
+        self.tick += n_ticks
+        return sum(value for _, value, _ in replies.values())
+
+    def pull(self):
+        """Copy the current state back into the graph, so it can be drawn, saved or compared."""
+        graph, world = self.graph, self.graph.world
+        for field, array in world.arrays().items():
+            array[...] = self.arrays[field]
+        world.resources_changed()
+        graph.tick = self.tick
+        graph.trades = None
+        i, j, _ = graph.find_pairs()
+        graph.pairs = (i, j)
+        return graph
+
+    def close(self, force=False):
+        if not self._blocks:
+            return
+        for conn, process in zip(self._connections, self._processes):
+            if force or not process.is_alive():
+                process.terminate()
+                continue
+            try:
+                conn.send(None)
+            except OSError:  # died since the check
+                process.terminate()
+        for process in self._processes:
+            process.join()
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks = {}
+
+
+def scaling(n_agents, ticks=20, density=5e-4, max_workers=None, seed=0):
+    """
+    Measure ticks per second from one worker up to all local cores on a square torus.
+    :param n_agents: Population size
+    :param ticks: Ticks timed per worker count (after one warm-up tick)
+    :param density: Agents per unit area, which sets the world size
+    :return: List of (workers, ticks per second)
+    """
+    side = int(np.sqrt(n_agents / density))
+    config = SimConfig(n_agents=n_agents, width=side, height=side)
+    max_strips = max(1, int(side // (2 * config.trade_distance)))
+    results = []
+    for workers in range(1, min(max_workers or os.cpu_count(), max_strips) + 1):
+        graph = random_graph(seed=seed, config=config)
+        with DistributedEngine(graph, workers) as engine:
+            engine.run(1)
+            start = time.perf_counter()
+            engine.run(ticks)
+            results.append((workers, ticks / (time.perf_counter() - start)))
+    return results
+
+
+def equivalence(config, workers, ticks=20, seed=0, noise_key=1):
+    """
+    Run the same world in one process and with `workers` strips and compare them after every tick.
+    :return: First tick at which any agent field differs, or None if all ticks match
+    """
+    reference = random_graph(seed=seed, config=config)
+    reference.world.use_counter_noise(noise_key)
+    graph = random_graph(seed=seed, config=config)
+    graph.world.use_counter_noise(noise_key)
+    with DistributedEngine(graph, workers) as engine:
+        for tick in range(ticks):
+            reference.update()
+            engine.run(1)
+            engine.pull()
+            expected = reference.world.arrays()
+            for field, array in graph.world.arrays().items():
+                if not np.array_equal(array, expected[field]):
+                    return tick
+    return None
+
+
+def verify(workers=(1, 2, 3, 6), ticks=20):
+    """
+    Check equivalence() on and off the torus, with short and long steps.
+    :return: List of (torus, stepsize, workers, first differing tick or None)
+    """
+    results = []
+    for torus in (True, False):
+        for stepsize in (5, 40):
+            config = SimConfig(
+                n_agents=3000, width=1200, height=600, torus=torus, trade_distance=50, stepsize=stepsize, steprate=1.0
+            )
+            for n in workers:
+                results.append((torus, stepsize, n, equivalence(config, n, ticks)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", type=int, default=1_000_000, help="number of agents")
+    parser.add_argument("--ticks", type=int, default=20, help="ticks timed per worker count")
+    parser.add_argument("--density", type=float, default=5e-4, help="agents per unit area")
+    parser.add_argument("--max-workers", type=int, default=None, help="largest worker count (default: all cores)")
+    parser.add_argument("--verify", action="store_true", help="compare against a single process instead of timing")
+    args = parser.parse_args()
+    if args.verify:
+        results = verify(ticks=args.ticks)
+        for torus, stepsize, workers, tick in results:
+            outcome = "identical" if tick is None else f"differs from tick {tick}"
+            print(f"torus={torus!s:5} stepsize={stepsize:2d} workers={workers}: {outcome}")
+        sys.exit(any(tick is not None for *_, tick in results))
+    for workers, rate in scaling(args.agents, args.ticks, args.density, args.max_workers):
+        print(f"{workers:3d} workers: {rate:8.2f} ticks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Run trading game simulations without a display, as fast as the CPU allows."""
+
+import argparse
+import time
+from dataclasses import dataclass
+
+from checkpoint import FrameRecorder, load_checkpoint, save_checkpoint
+from profiling import Profiler
+from simulation import N_AGENTS, RESOURCE_LIST, random_graph
+from trade_log import TradeRecorder
+from trade_network import TradeNetwork
+from wealth_stats import WealthStats
+
+
+@dataclass
+class RunResult:
+    winner: str | None  # name of the first agent to reach the win amount
+    ticks: int  # number of ticks simulated
+    totals: dict  # final output of AgentGraph.count_all_resources
+    elapsed: float  # wall-clock seconds spent simulating
+
+    @property
+    def ticks_per_second(self):
+        return self.ticks / self.elapsed if self.elapsed > 0 else float("inf")
+
+    def __str__(self):
+        winner = self.winner if self.winner is not None else "nobody"
+        return (
+            f"{winner} wins after {self.ticks} ticks "
+            f"({self.ticks_per_second:.1f} ticks/s), totals: {self.totals}"
+        )
+
+
+def run_headless(graph, max_ticks=10_000, stop_on_winner=True):
+    """
+    Advance a graph without rendering.
+    :param graph: AgentGraph to simulate
+    :param max_ticks: Upper bound on the number of ticks
+    :param stop_on_winner: Stop as soon as check_for_winner finds someone
+    :return: RunResult
+    """
+    winner = None
+    ticks = 0
+    start = time.perf_counter()
+    while ticks < max_ticks:
+        graph.update()
+        ticks += 1
+        agent = graph.check_for_winner()
+        if agent is not None and winner is None:
+            winner = agent.name
+            if stop_on_winner:
+                break
+    elapsed = time.perf_counter() - start
+    return RunResult(winner, ticks, dict(graph.count_all_resources()), elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", type=int, default=N_AGENTS, help="number of agents")
+    parser.add_argument("--ticks", type=int, default=10_000, help="maximum number of ticks")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the population and the tick random draws")
+    parser.add_argument("--no-stop", action="store_true", help="keep running after the first winner")
+    parser.add_argument("--log", default=None, help="write every transfer to this binary trade log")
+    parser.add_argument("--verbose", action="store_true", help="print every trade")
+    parser.add_argument("--resume", default=None, help="continue from this checkpoint directory")
+    parser.add_argument("--checkpoint", default=None, help="save the final state to this directory")
+    parser.add_argument("--record", default=None, help="record every tick to this directory for replay")
+    parser.add_argument("--network", default=None, help="accumulate the trade network and save it to this .npz file")
+    parser.add_argument("--stats", default=None, help="track wealth statistics and save their time series to this .npz file")
+    parser.add_argument("--profile", default=None, help="write per-phase timings and per-tick counters to this JSON file")
+    args = parser.parse_args()
+
+    if args.resume is not None:
+        graph = load_checkpoint(args.resume, mmap=True)
+    else:
+        graph = random_graph(args.agents, seed=args.seed)
+    graph.verbose = args.verbose
+    if args.log is not None:
+        graph.recorder = TradeRecorder(args.log)
+    if args.record is not None:
+        graph.frame_recorder = FrameRecorder(graph, args.record)
+    if args.profile is not None:
+        graph.profiler = Profiler(window=None)
+    if args.network is not None:
+        graph.network = TradeNetwork(graph.world.next_uid)
+    if args.stats is not None:
+        graph.stats = WealthStats(graph.world)
+    try:
+        print(run_headless(graph, max_ticks=args.ticks, stop_on_winner=not args.no_stop))
+    finally:
+        for recorder in (graph.recorder, graph.frame_recorder):
+            if recorder is not None:
+                recorder.close()
+    if args.checkpoint is not None:
+        save_checkpoint(graph, args.checkpoint)
+    if graph.network is not None:
+        print(graph.network.summary())
+        graph.network.save(args.network)
+    if graph.stats is not None:
+        print("\n".join(graph.stats.report_lines(RESOURCE_LIST)))
+        graph.stats.save(args.stats)
+    if graph.profiler is not None:
+        print("\n".join(graph.profiler.report_lines()))
+        graph.profiler.export(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,300 @@
 import numpy as np
 
 
+def minibatches(data, batch_size, rng=None, shuffle=True):
+    """
+    Yield successive minibatches covering `data` once.
+    :param data: Array of samples (rows)
+    :param batch_size: Rows per batch (the last batch may be smaller)
+    :param rng: np.random.Generator used for shuffling
+    :param shuffle: Visit the rows in random order
+    """
+    n = len(data)
+    order = (rng if rng is not None else np.random.default_rng()).permutation(n) if shuffle else None
+    for start in range(0, n, batch_size):
+        if order is None:
+            yield data[start : start + batch_size]
+        else:
+            yield data[np.sort(order[start : start + batch_size])]
+
+
+def logsumexp(x, axis=None):
+    """Numerically stable log(sum(exp(x)))."""
+    top = np.max(x, axis=axis, keepdims=True)
+    top = np.where(np.isfinite(top), top, 0)
+    return np.squeeze(top, axis=axis) + np.log(np.sum(np.exp(x - top), axis=axis))
+
+
+def binary_states(start, stop, n_units):
+    """All binary vectors whose integer codes lie in [start, stop), one per row."""
+    codes = np.arange(start, stop, dtype=np.int64)
+    return ((codes[:, None] >> np.arange(n_units)) & 1).astype(np.float64)
+
+
+def exponential_decay(initial, decay, every=1):
+    """Learning-rate schedule: `initial * decay ** (step // every)`."""
+    return lambda step: initial * decay ** (step // every)
+
+
+def inverse_time_decay(initial, decay):
+    """Learning-rate schedule: `initial / (1 + decay * step)`."""
+    return lambda step: initial / (1 + decay * step)
+
+
 class RestrictedBoltzmannMachine:
-    def __init__(self, n_visible, n_hidden, learning_rate=0.1):
+    def __init__(self, n_visible, n_hidden, learning_rate=0.1, dtype=np.float32, seed=None):
         """
         Initialize the RBM with the given number of visible and hidden units.
         :param n_visible: Number of visible units
         :param n_hidden: Number of hidden units
         :param learning_rate: Learning rate for training
+        :param dtype: Floating point type of the parameters and all computations
+        :param seed: Seed for the sampler (default: drawn from np.random, so np.random.seed still applies)
         """
         self.n_visible = n_visible
         self.n_hidden = n_hidden
         self.learning_rate = learning_rate
+        self.dtype = np.dtype(dtype)
+        self.rng = np.random.default_rng(np.random.randint(2**32) if seed is None else seed)
 
         # Initialize weights and biases
-        self.weights = np.random.normal(0, 0.1, (n_visible, n_hidden))  # Weight matrix
-        self.visible_bias = np.zeros(n_visible)  # Bias for visible units
-        self.hidden_bias = np.zeros(n_hidden)  # Bias for hidden units
+        self.weights = self.rng.normal(0, 0.1, (n_visible, n_hidden)).astype(self.dtype)  # Weight matrix
+        self.visible_bias = np.zeros(n_visible, dtype=self.dtype)  # Bias for visible units
+        self.hidden_bias = np.zeros(n_hidden, dtype=self.dtype)  # Bias for hidden units
+
+        self.fantasy = None  # persistent negative chain, see gradients(persistent=True)
+        self._workspaces = {}  # Gibbs buffers keyed by batch size
+        self._grads = [np.zeros_like(p) for p in self.parameters()]
 
-    def sigmoid(self, x):
-        """Sigmoid activation function."""
-        return 1 / (1 + np.exp(-x))
+    def sigmoid(self, x, out=None):
+        """Sigmoid activation function, computed as (1 + tanh(x / 2)) / 2 so it never overflows."""
+        out = np.multiply(x, 0.5, out=out)
+        np.tanh(out, out=out)
+        out *= 0.5
+        out += 0.5
+        return out
 
-    def sample_hidden(self, visible):
-        """Sample hidden units given visible units."""
-        activation = np.dot(visible, self.weights) + self.hidden_bias
-        probabilities = self.sigmoid(activation)
-        return probabilities, np.random.binomial(1, probabilities)
+    def bernoulli(self, probabilities, out=None):
+        """Draw 0/1 samples with the given probabilities by comparing against uniforms."""
+        if out is None:
+            out = np.empty_like(probabilities)
+        self.rng.random(out=out, dtype=out.dtype)
+        return np.less(out, probabilities, out=out)
 
-    def sample_visible(self, hidden):
-        """Sample visible units given hidden units."""
-        activation = np.dot(hidden, self.weights.T) + self.visible_bias
-        probabilities = self.sigmoid(activation)
-        return probabilities, np.random.binomial(1, probabilities)
+    def _workspace(self, n):
+        """Preallocated (probabilities, states) buffers for a batch of n rows."""
+        workspace = self._workspaces.get(n)
+        if workspace is None:
+            workspace = {
+                name: (np.empty((n, units), dtype=self.dtype), np.empty((n, units), dtype=self.dtype))
+                for name, units in [("pos_hidden", self.n_hidden), ("hidden", self.n_hidden), ("visible", self.n_visible)]
+            }
+            self._workspaces[n] = workspace
+        return workspace
 
-    def contrastive_divergence(self, data, k=1):
+    def _sample(self, inputs, weights, bias, out):
+        inputs = np.asarray(inputs, dtype=self.dtype)
+        if out is None:
+            activation = np.dot(inputs, weights) + bias
+            probabilities = self.sigmoid(activation, out=activation)
+            return probabilities, self.bernoulli(probabilities)
+        probabilities, states = out
+        np.dot(inputs, weights, out=probabilities)
+        probabilities += bias
+        self.sigmoid(probabilities, out=probabilities)
+        self.bernoulli(probabilities, out=states)
+        return probabilities, states
+
+    def sample_hidden(self, visible, out=None):
         """
-        Perform Contrastive Divergence (CD-k) to update weights and biases.
+        Sample hidden units given visible units.
+        :param out: Optional (probabilities, states) arrays to write the result into
+        """
+        return self._sample(visible, self.weights, self.hidden_bias, out)
+
+    def sample_visible(self, hidden, out=None):
+        """
+        Sample visible units given hidden units.
+        :param out: Optional (probabilities, states) arrays to write the result into
+        """
+        return self._sample(hidden, self.weights.T, self.visible_bias, out)
+
+    def init_fantasy(self, data, n_particles):
+        """Start the persistent chain from `n_particles` random rows of data."""
+        rows = self.rng.choice(len(data), n_particles, replace=n_particles > len(data))
+        self.fantasy = np.array(data[np.sort(rows)], dtype=self.dtype)
+
+    def gradients(self, data, k=1, persistent=False):
+        """
+        Estimate the log-likelihood gradient on a batch with Contrastive Divergence (CD-k).
+
+        With `persistent` the negative phase continues the fantasy particles left by the
+        previous call (PCD) instead of restarting from the data. All intermediate arrays are
+        reused between calls, so the returned gradients are overwritten by the next call.
         :param data: Input data (batch of visible units)
         :param k: Number of Gibbs sampling steps
+        :param persistent: Use Persistent Contrastive Divergence
+        :return: Gradients for weights, visible_bias and hidden_bias, averaged over the batch
         """
+        weights_grad, visible_bias_grad, hidden_bias_grad = self._grads
+        data = np.asarray(data, dtype=self.dtype)
+        workspace = self._workspace(data.shape[0])
+
         # Positive phase
-        pos_hidden_probs, pos_hidden_states = self.sample_hidden(data)
-        pos_associations = np.dot(data.T, pos_hidden_probs)
+        pos_hidden_probs, pos_hidden_states = self.sample_hidden(data, out=workspace["pos_hidden"])
+        np.dot(data.T, pos_hidden_probs, out=weights_grad)
+        weights_grad /= data.shape[0]
 
         # Negative phase
-        visible = data
-        for _ in range(k):
-            hidden_probs, hidden_states = self.sample_hidden(visible)
-            visible_probs, visible_states = self.sample_visible(hidden_states)
-            visible = visible_states
+        if persistent:
+            if self.fantasy is None:
+                self.init_fantasy(data, data.shape[0])
+            visible = self.fantasy
+            chain = self._workspace(len(visible))
+            hidden_states = self.sample_hidden(visible, out=chain["hidden"])[1]
+        else:
+            # the positive phase already sampled the hidden units for the first step
+            chain = workspace
+            hidden_states = pos_hidden_states
+        for step in range(k):
+            if step:
+                hidden_states = self.sample_hidden(visible, out=chain["hidden"])[1]
+            visible = self.sample_visible(hidden_states, out=chain["visible"])[1]
+        if persistent:
+            self.fantasy[...] = visible
+
+        neg_hidden_probs, _ = self.sample_hidden(visible, out=chain["hidden"])
+        weights_grad -= np.dot(visible.T, neg_hidden_probs) / len(visible)
 
-        neg_hidden_probs, _ = self.sample_hidden(visible)
-        neg_associations = np.dot(visible.T, neg_hidden_probs)
+        np.mean(data, axis=0, out=visible_bias_grad)
+        visible_bias_grad -= np.mean(visible, axis=0)
+        np.mean(pos_hidden_probs, axis=0, out=hidden_bias_grad)
+        hidden_bias_grad -= np.mean(neg_hidden_probs, axis=0)
+        return self._grads
+
+    def contrastive_divergence(self, data, k=1, persistent=False):
+        """
+        Perform Contrastive Divergence (CD-k) to update weights and biases.
+        :param data: Input data (batch of visible units)
+        :param k: Number of Gibbs sampling steps
+        :param persistent: Use Persistent Contrastive Divergence
+        """
+        weights_grad, visible_bias_grad, hidden_bias_grad = self.gradients(data, k, persistent)
 
         # Update weights and biases
-        self.weights += self.learning_rate * (pos_associations - neg_associations) / data.shape[0]
-        self.visible_bias += self.learning_rate * np.mean(data - visible, axis=0)
-        self.hidden_bias += self.learning_rate * np.mean(pos_hidden_probs - neg_hidden_probs, axis=0)
+        self.weights += self.learning_rate * weights_grad
+        self.visible_bias += self.learning_rate * visible_bias_grad
+        self.hidden_bias += self.learning_rate * hidden_bias_grad
+
+    def parameters(self):
+        return [self.weights, self.visible_bias, self.hidden_bias]
+
+    def fit(
+        self,
+        data,
+        epochs=10,
+        batch_size=100,
+        k=1,
+        persistent=False,
+        n_particles=None,
+        learning_rate=None,
+        momentum=0.0,
+        weight_decay=0.0,
+        eval_every=100,
+        eval_size=1000,
+        validation_data=None,
+        patience=None,
+        track_likelihood=False,
+        gradients=None,
+        seed=None,
+        verbose=False,
+    ):
+        """
+        Train with shuffled minibatches, momentum and weight decay.
+        :param data: Training data (samples x n_visible), or a streaming source such as
+            rbm_data.PackedDataset that provides batches(batch_size, rng)
+        :param epochs: Number of passes over the data
+        :param batch_size: Rows per minibatch
+        :param k: Number of Gibbs sampling steps per update
+        :param persistent: Use Persistent Contrastive Divergence
+        :param n_particles: Number of persistent fantasy particles (default: batch_size)
+        :param learning_rate: Float, or a schedule mapping the step number to a rate (default: self.learning_rate)
+        :param momentum: Fraction of the previous update carried into the next one
+        :param weight_decay: L2 penalty on the weights
+        :param eval_every: Measure the reconstruction error every this many steps (0 to disable)
+        :param eval_size: Number of training rows sampled for each evaluation
+        :param validation_data: Held-out data; enables early stopping together with `patience`
+        :param patience: Stop after this many evaluations without a better validation error
+        :param track_likelihood: Also record the average log-likelihood of the evaluation sample
+        :param gradients: Replacement for self.gradients with the same signature, e.g.
+            parallel_rbm.ParallelTrainer.gradients
+        :param seed: Seed for shuffling and evaluation sampling
+        :param verbose: Print every evaluation
+        :return: History dict with lists "step", "train_error", "validation_error" and "log_likelihood"
+        """
+        rng = np.random.default_rng(seed)
+        if gradients is None:
+            gradients = self.gradients
+        if learning_rate is None:
+            learning_rate = self.learning_rate
+        schedule = learning_rate if callable(learning_rate) else (lambda step: learning_rate)
+        velocity = [np.zeros_like(p) for p in self.parameters()]
+        history = {"step": [], "train_error": [], "validation_error": [], "log_likelihood": []}
+        best_error, best_parameters, bad_evaluations = np.inf, None, 0
+        if persistent:
+            self.init_fantasy(data, n_particles or batch_size)
+
+        step = 0
+        for epoch in range(epochs):
+            if hasattr(data, "batches"):
+                batches = data.batches(batch_size, rng)
+            else:
+                batches = minibatches(data, batch_size, rng)
+            for batch in batches:
+                rate = schedule(step)
+                for v, gradient in zip(velocity, gradients(batch, k, persistent)):
+                    v *= momentum
+                    v += rate * gradient
+                # weight decay applies to the weights only, not the biases
+                velocity[0] -= rate * weight_decay * self.weights
+                for parameter, v in zip(self.parameters(), velocity):
+                    parameter += v
+                step += 1
+
+                if not eval_every or step % eval_every:
+                    continue
+                sample = data[rng.choice(len(data), min(eval_size, len(data)), replace=False)]
+                train_error = self.reconstruction_error(sample)
+                validation_error = None if validation_data is None else self.reconstruction_error(validation_data)
+                history["step"].append(step)
+                history["train_error"].append(train_error)
+                history["validation_error"].append(validation_error)
+                log_likelihood = self.log_likelihood(sample) if track_likelihood else None
+                history["log_likelihood"].append(log_likelihood)
+                if verbose:
+                    message = f"Epoch {epoch + 1}/{epochs}, step {step}, Reconstruction Error: {train_error:.4f}"
+                    if validation_error is not None:
+                        message += f", Validation Error: {validation_error:.4f}"
+                    if log_likelihood is not None:
+                        message += f", Log-likelihood: {log_likelihood:.4f}"
+                    print(message)
+
+                if validation_error is None or patience is None:
+                    continue
+                if validation_error < best_error:
+                    best_error, bad_evaluations = validation_error, 0
+                    best_parameters = [p.copy() for p in self.parameters()]
+                else:
+                    bad_evaluations += 1
+                    if bad_evaluations >= patience:
+                        for parameter, best in zip(self.parameters(), best_parameters):
+                            parameter[...] = best
+                        return history
+        return history
+
+    def reconstruction_error(self, data):
+        """Mean squared error between data and its mean-field reconstruction."""
+        return float(np.mean((data - self.reconstruct(data)) ** 2))
 
     def reconstruct(self, data):
         """
@@ -68,3 +305,93 @@ class RestrictedBoltzmannMachine:
         hidden_probs, _ = self.sample_hidden(data)
         visible_probs, _ = self.sample_visible(hidden_probs)
         return visible_probs
+
+    def free_energy(self, visible):
+        """
+        Free energy F(v) = -v.visible_bias - sum_j softplus(hidden_bias_j + (v W)_j), so p(v) = exp(-F(v)) / Z.
+        :param visible: Batch of visible vectors
+        :return: Free energy of each row (float64)
+        """
+        visible = np.asarray(visible, dtype=np.float64)
+        activation = visible @ self.weights.astype(np.float64) + self.hidden_bias
+        return -(visible @ self.visible_bias.astype(np.float64)) - np.logaddexp(0, activation).sum(axis=1)
+
+    def log_partition_exact(self, chunk_size=1 << 16, max_units=24):
+        """
+        Exact log Z, summing over every state of the smaller layer in chunks.
+        :param chunk_size: States evaluated at once
+        :param max_units: Refuse to enumerate more than 2**max_units states
+        """
+        weights = self.weights.astype(np.float64)
+        visible_bias = self.visible_bias.astype(np.float64)
+        hidden_bias = self.hidden_bias.astype(np.float64)
+        n_units = min(self.n_visible, self.n_hidden)
+        if n_units > max_units:
+            raise ValueError(f"exact partition function needs 2**{n_units} states, use log_partition_ais")
+
+        partial = []
+        for start in range(0, 2**n_units, chunk_size):
+            states = binary_states(start, min(start + chunk_size, 2**n_units), n_units)
+            if self.n_hidden <= self.n_visible:
+                # sum out the visible layer analytically for every hidden state
+                log_weights = states @ hidden_bias + np.logaddexp(0, states @ weights.T + visible_bias).sum(axis=1)
+            else:
+                log_weights = -self.free_energy(states)
+            partial.append(logsumexp(log_weights))
+        return float(logsumexp(np.array(partial)))
+
+    def log_partition_ais(self, n_chains=100, betas=None, base_visible_bias=None):
+        """
+        Estimate log Z with Annealed Importance Sampling, running all chains as one batch.
+
+        The base distribution has no weights and independent visible units, and the chains
+        anneal from it to this model along the inverse temperatures `betas`.
+        :param n_chains: Number of parallel annealing runs
+        :param betas: Increasing inverse temperatures from 0 to 1 (default: 7500 steps, denser near 1)
+        :param base_visible_bias: Visible biases of the base model, e.g. logit of the data means
+        :return: (log Z estimate, standard error of the estimate)
+        """
+        if betas is None:
+            betas = np.concatenate(
+                [np.linspace(0, 0.5, 500, endpoint=False), np.linspace(0.5, 0.9, 2000, endpoint=False), np.linspace(0.9, 1, 5000)]
+            )
+        weights = self.weights.astype(np.float64)
+        visible_bias = self.visible_bias.astype(np.float64)
+        hidden_bias = self.hidden_bias.astype(np.float64)
+        base_bias = np.zeros(self.n_visible) if base_visible_bias is None else np.asarray(base_visible_bias, dtype=np.float64)
+
+        def log_unnormalized(visible, beta):
+            activation = beta * (visible @ weights + hidden_bias)
+            return (1 - beta) * (visible @ base_bias) + beta * (visible @ visible_bias) + np.logaddexp(0, activation).sum(axis=1)
+
+        visible = (self.rng.random((n_chains, self.n_visible)) < 1 / (1 + np.exp(-base_bias))).astype(np.float64)
+        log_w = np.zeros(n_chains)
+        for previous, beta in zip(betas[:-1], betas[1:]):
+            log_w += log_unnormalized(visible, beta) - log_unnormalized(visible, previous)
+            # one Gibbs sweep that leaves the intermediate distribution at `beta` invariant
+            hidden_probs = self.sigmoid(beta * (visible @ weights + hidden_bias))
+            hidden = (self.rng.random(hidden_probs.shape) < hidden_probs).astype(np.float64)
+            visible_probs = self.sigmoid((1 - beta) * base_bias + beta * (hidden @ weights.T + visible_bias))
+            visible = (self.rng.random(visible_probs.shape) < visible_probs).astype(np.float64)
+
+        log_z_base = np.logaddexp(0, base_bias).sum() + self.n_hidden * np.log(2)
+        log_mean_w = logsumexp(log_w) - np.log(n_chains)
+        # delta method on the mean of the importance weights
+        w = np.exp(log_w - log_w.max())
+        std_error = w.std() / (np.sqrt(n_chains) * w.mean())
+        return float(log_z_base + log_mean_w), float(std_error)
+
+    def log_partition(self, max_units=20, **ais_options):
+        """log Z: exact when the smaller layer has at most `max_units` units, otherwise by AIS."""
+        if min(self.n_visible, self.n_hidden) <= max_units:
+            return self.log_partition_exact(max_units=max_units)
+        return self.log_partition_ais(**ais_options)[0]
+
+    def log_likelihood(self, data, log_z=None):
+        """
+        Average log-likelihood of the rows of data.
+        :param log_z: Precomputed log partition function (default: log_partition())
+        """
+        if log_z is None:
+            log_z = self.log_partition()
+        return float(np.mean(-self.free_energy(data)) - log_z)
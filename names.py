@@ -1,110 +1,141 @@
 import random
 import string
 
+import numpy as np
 
-def generate_random_name(sylb=2):
+VOWELS = "aeiou"
+CONSONANTS = "bcdfghjklmnpqrstvwxyz"
+SYLLABLES = tuple(c + v for c in "bdfghjklmnprstvwyz" for v in VOWELS)
+
+_SLOT_WIDTH = 4  # syllable + optional vowel + optional consonant
+
+
+def _slot_cells():
+    """
+    Every way to fill a name slot, as _SLOT_WIDTH zero-padded bytes viewed as one uint32.
+    Cell 1 + (syllable * 6 + vowel) * 22 + consonant holds that syllable followed by the
+    optional vowel and consonant (0 = none); cell 0 is an empty slot.
+    """
+    cells = [""]
+    for syllable in SYLLABLES:
+        for vowel in ("",) + tuple(VOWELS):
+            cells.extend(syllable + vowel + consonant for consonant in ("",) + tuple(CONSONANTS))
+    return np.array([cell.encode() for cell in cells], dtype=f"S{_SLOT_WIDTH}").view(np.uint32)
+
+
+def _slot_draws():
+    """
+    Cell indices repeated in proportion to their probability under generate_random_name, so one
+    uniform draw from the table picks a whole slot: the extra vowel and the extra consonant each
+    come with probability 0.1, i.e. weights 45 : 1 per vowel and 189 : 1 per consonant.
+    """
+    vowel = np.array([45] + [1] * len(VOWELS))
+    consonant = np.array([189] + [1] * len(CONSONANTS))
+    weights = np.tile(np.outer(vowel, consonant).ravel(), len(SYLLABLES))
+    return np.repeat(np.arange(1, len(weights) + 1, dtype=np.int16), weights)
+
+
+_SLOT_CELLS = _slot_cells()
+_SLOT_DRAWS = _slot_draws()
+_MAX_UNIQUE_SLOTS = 4  # keys of up to this many slots fit an int64
+
+
+def generate_random_name(sylb=2, rng=random):
     """Generate a random name following common English name tendencies."""
-    vowels = "aeiou"
-    consonants = "bcdfghjklmnpqrstvwxyz"
-    syllables = [
-        "ba",
-        "be",
-        "bi",
-        "bo",
-        "bu",
-        "da",
-        "de",
-        "di",
-        "do",
-        "du",
-        "fa",
-        "fe",
-        "fi",
-        "fo",
-        "fu",
-        "ga",
-        "ge",
-        "gi",
-        "go",
-        "gu",
-        "ha",
-        "he",
-        "hi",
-        "ho",
-        "hu",
-        "ja",
-        "je",
-        "ji",
-        "jo",
-        "ju",
-        "ka",
-        "ke",
-        "ki",
-        "ko",
-        "ku",
-        "la",
-        "le",
-        "li",
-        "lo",
-        "lu",
-        "ma",
-        "me",
-        "mi",
-        "mo",
-        "mu",
-        "na",
-        "ne",
-        "ni",
-        "no",
-        "nu",
-        "pa",
-        "pe",
-        "pi",
-        "po",
-        "pu",
-        "ra",
-        "re",
-        "ri",
-        "ro",
-        "ru",
-        "sa",
-        "se",
-        "si",
-        "so",
-        "su",
-        "ta",
-        "te",
-        "ti",
-        "to",
-        "tu",
-        "va",
-        "ve",
-        "vi",
-        "vo",
-        "vu",
-        "wa",
-        "we",
-        "wi",
-        "wo",
-        "wu",
-        "ya",
-        "ye",
-        "yi",
-        "yo",
-        "yu",
-        "za",
-        "ze",
-        "zi",
-        "zo",
-        "zu",
-    ]
     name = ""
 
     for i in range(sylb):
-        name = name + random.choice(syllables)
-        if random.random() < 0.1:
-            name = name + random.choice(vowels)
-        if random.random() < 0.1:
-            name = name + random.choice(consonants)
+        name = name + rng.choice(SYLLABLES)
+        if rng.random() < 0.1:
+            name = name + rng.choice(VOWELS)
+        if rng.random() < 0.1:
+            name = name + rng.choice(CONSONANTS)
 
     return "".join(name).capitalize()
+
+
+def _draw_slots(n, sylb, rng):
+    """
+    n names as rows of cell indices into _SLOT_CELLS, drawn with the tendencies of generate_random_name.
+    Rows always have max(sylb) columns, zero-padded, so keys of one name agree across draws.
+    """
+    counts = rng.choice(np.atleast_1d(sylb), size=n)
+    shape = (n, int(np.max(sylb)))
+    index = _SLOT_DRAWS[rng.integers(len(_SLOT_DRAWS), size=shape, dtype=np.int32)]
+    index[np.arange(shape[1]) >= counts[:, None]] = 0
+    return index
+
+
+def _slot_keys(index):
+    """One int64 per name; slots always start with a consonant and a vowel, so equal names have equal cells."""
+    keys = index[:, 0].astype(np.int64)
+    for column in index.T[1:]:
+        keys *= len(_SLOT_CELLS)
+        keys += column
+    return keys
+
+
+def _first_new(taken, keys):
+    """
+    Positions of the first occurrence of every key that is not in `taken`, in increasing order,
+    and the sorted union of `taken` and `keys`.
+    :param taken: Sorted unique keys
+    """
+    merged = np.concatenate((taken, keys))
+    if len(merged) == 0:
+        return np.empty(0, dtype=np.int64), merged
+    # an unstable sort is several times quicker; the smallest position of each run is its first occurrence
+    order = np.argsort(merged)
+    merged = merged[order]
+    start = np.flatnonzero(np.r_[True, merged[1:] != merged[:-1]])
+    first = np.minimum.reduceat(order, start)
+    return np.sort(first[first >= len(taken)]) - len(taken), merged[start]
+
+
+def _as_str(index):
+    n, slots = index.shape
+    chars = np.zeros((n, slots * _SLOT_WIDTH + 1), dtype=np.uint8)
+    chars[:, :-1] = _SLOT_CELLS[index].view(np.uint8).reshape(n, slots * _SLOT_WIDTH)
+    chars[:, 0] -= np.uint8(ord("a") - ord("A"))
+    chars[:, -1] = ord("\n")
+    # deleting the zero padding joins the slots of each name, the newlines keep the names apart
+    return chars.tobytes().translate(None, b"\0").decode("ascii").split("\n")[:-1]
+
+
+def generate_names(n, sylb=2, rng=None, unique=False, exclude=(), max_rounds=100):
+    """
+    Generate n random names at once, with the same tendencies as generate_random_name.
+    :param n: Number of names
+    :param sylb: Number of syllables, or a sequence of counts to choose from uniformly per name
+    :param rng: np.random.Generator or seed (default: fresh entropy)
+    :param unique: Make the names distinct from each other and from `exclude` (at most 4 syllables)
+    :param exclude: Names that must not be produced when `unique` is set; a set or dict (such as
+        World.names_in_use) is used as is, anything else is copied into a set
+    :param max_rounds: Give up on uniqueness after this many rounds of redrawing duplicates
+    :return: List of names
+    """
+    rng = np.random.default_rng(rng)
+    if not unique:
+        return _as_str(_draw_slots(n, sylb, rng))
+    if int(np.max(sylb)) > _MAX_UNIQUE_SLOTS:
+        raise ValueError(f"unique names can have at most {_MAX_UNIQUE_SLOTS} syllables")
+
+    if not isinstance(exclude, (set, frozenset, dict)):
+        exclude = set(exclude)
+    taken = np.empty(0, dtype=np.int64)  # sorted keys of every name drawn so far
+    kept = []
+    missing, draw = n, n
+    for _ in range(max_rounds):
+        index = _draw_slots(draw, sylb, rng)
+        first, taken = _first_new(taken, _slot_keys(index))
+        names = _as_str(index[first])
+        if exclude:
+            names = [name for name in names if name not in exclude]
+        accepted = len(names)
+        kept.extend(names[:missing])
+        missing -= min(accepted, missing)
+        if not missing:
+            return kept
+        # draw enough for the remaining names at the acceptance rate seen so far
+        draw = int(missing * min(1.25 * draw / max(accepted, 1), 100)) + 16
+    raise ValueError(f"could not generate {n} unique names with {sylb} syllables")
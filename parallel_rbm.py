@@ -0,0 +1,164 @@
+"""Data-parallel RBM training: minibatches sharded across worker processes sharing the parameters."""
+
+import multiprocessing
+import os
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models import RestrictedBoltzmannMachine
+
+# environment variables read by the common BLAS / OpenMP runtimes when they start
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+@contextmanager
+def pinned_threads(n_threads):
+    """Temporarily set the BLAS thread-count variables, so processes started inside inherit them."""
+    saved = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update({name: str(n_threads) for name in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _parameter_views(buffer, n_visible, n_hidden, dtype):
+    """Split a flat buffer into (weights, visible_bias, hidden_bias) arrays."""
+    flat = np.ndarray((n_visible * n_hidden + n_visible + n_hidden,), dtype=dtype, buffer=buffer)
+    weights = flat[: n_visible * n_hidden].reshape(n_visible, n_hidden)
+    visible_bias = flat[n_visible * n_hidden : n_visible * n_hidden + n_visible]
+    hidden_bias = flat[n_visible * n_hidden + n_visible :]
+    return flat, [weights, visible_bias, hidden_bias]
+
+
+def _serve(conn, parameters, gradients, index, n_visible, n_hidden, dtype, seed):
+    rbm = RestrictedBoltzmannMachine(n_visible, n_hidden, dtype=dtype, seed=seed)
+    _, (rbm.weights, rbm.visible_bias, rbm.hidden_bias) = _parameter_views(parameters.buf, n_visible, n_hidden, dtype)
+    size = n_visible * n_hidden + n_visible + n_hidden
+    slot = np.ndarray((size,), dtype=dtype, buffer=gradients.buf, offset=index * size * np.dtype(dtype).itemsize)
+    _, outputs = _parameter_views(slot, n_visible, n_hidden, dtype)
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        shard, k, persistent = message
+        # sums rather than means, so the driver can weight shards by their size
+        for out, gradient in zip(outputs, rbm.gradients(shard, k, persistent)):
+            np.multiply(gradient, len(shard), out=out)
+        conn.send(len(shard))
+
+
+def _worker(conn, parameters_name, gradients_name, *args):
+    parameters = shared_memory.SharedMemory(name=parameters_name)
+    gradients = shared_memory.SharedMemory(name=gradients_name)
+    try:
+        _serve(conn, parameters, gradients, *args)
+    finally:
+        parameters.close()
+        gradients.close()
+
+
+class ParallelTrainer:
+    """
+    Compute RBM gradients on several cores by splitting each minibatch across worker processes.
+
+    The weights and biases of `rbm` are moved into a shared-memory block that every worker maps,
+    so only the data shards travel between processes. Each worker writes the summed gradient of
+    its shard into its own slot of a second shared block and the driver adds the slots up in
+    worker order. Worker i samples from SeedSequence(seed).spawn(workers)[i], so a run is
+    reproducible for a given seed and number of workers. With persistent=True every worker keeps
+    its own fantasy particles, one per row of its first shard.
+
+    Use as a context manager; on exit the parameters are copied back into ordinary arrays.
+    """
+
+    def __init__(self, rbm, workers=None, threads_per_worker=1, seed=None, start_method="spawn"):
+        """
+        :param rbm: RestrictedBoltzmannMachine to train
+        :param workers: Number of worker processes (default: os.cpu_count())
+        :param threads_per_worker: BLAS threads allowed in each worker
+        :param seed: Seed for the workers' samplers (default: drawn from rbm.rng)
+        :param start_method: multiprocessing start method for the workers
+        """
+        self.rbm = rbm
+        self.workers = workers or os.cpu_count()
+        n_visible, n_hidden, dtype = rbm.n_visible, rbm.n_hidden, rbm.dtype
+        size = n_visible * n_hidden + n_visible + n_hidden
+
+        self._parameters = shared_memory.SharedMemory(create=True, size=size * dtype.itemsize)
+        self._gradients = shared_memory.SharedMemory(create=True, size=self.workers * size * dtype.itemsize)
+        _, views = _parameter_views(self._parameters.buf, n_visible, n_hidden, dtype)
+        for view, parameter in zip(views, rbm.parameters()):
+            view[...] = parameter
+        rbm.weights, rbm.visible_bias, rbm.hidden_bias = views
+        self.slots = np.ndarray((self.workers, size), dtype=dtype, buffer=self._gradients.buf)
+
+        if seed is None:
+            seed = int(rbm.rng.integers(2**32))
+        seeds = np.random.SeedSequence(seed).spawn(self.workers)
+        context = multiprocessing.get_context(start_method)
+        self.connections, self.processes = [], []
+        with pinned_threads(threads_per_worker):
+            for index in range(self.workers):
+                parent, child = context.Pipe()
+                process = context.Process(
+                    target=_worker,
+                    args=(child, self._parameters.name, self._gradients.name, index, n_visible, n_hidden, dtype, seeds[index]),
+                    daemon=True,
+                )
+                process.start()
+                self.connections.append(parent)
+                self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def gradients(self, data, k=1, persistent=False):
+        """
+        Drop-in replacement for RestrictedBoltzmannMachine.gradients computed by the workers.
+        :return: Gradients for weights, visible_bias and hidden_bias, averaged over the batch
+        """
+        shards = np.array_split(np.asarray(data), self.workers)
+        busy = []
+        for connection, shard in zip(self.connections, shards):
+            if len(shard):
+                connection.send((shard, k, persistent))
+                busy.append(connection)
+        total = sum(connection.recv() for connection in busy)
+
+        result = self.rbm._grads
+        flat = np.sum(self.slots[: len(busy)], axis=0)
+        flat /= total
+        offset = 0
+        for gradient in result:
+            gradient.ravel()[...] = flat[offset : offset + gradient.size]
+            offset += gradient.size
+        return result
+
+    def fit(self, data, **options):
+        """Run RestrictedBoltzmannMachine.fit with the gradients computed by the workers."""
+        return self.rbm.fit(data, gradients=self.gradients, **options)
+
+    def close(self):
+        if self._parameters is None:
+            return
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        rbm = self.rbm
+        rbm.weights, rbm.visible_bias, rbm.hidden_bias = [p.copy() for p in rbm.parameters()]
+        self.slots = None
+        for block in (self._parameters, self._gradients):
+            block.close()
+            block.unlink()
+        self._parameters = self._gradients = None
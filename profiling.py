@@ -0,0 +1,116 @@
+"""Low-overhead per-phase timers and per-tick counters for the simulation and the renderer."""
+
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class _Phase:
+    """Reusable timing context: `with profiler.phase(name): ...` appends the elapsed seconds."""
+
+    __slots__ = ("samples", "start")
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Rolling wall-clock timings per phase and per-tick event counters.
+
+    Instrumented objects (AgentGraph, Renderer, App) hold a `profiler` attribute that is None
+    by default; every hook checks it once, so profiling costs nothing while it is switched off.
+    Only the last `window` samples of each series are kept (all of them with window=None),
+    while counter totals cover the whole run.
+    """
+
+    def __init__(self, window=300):
+        """
+        :param window: Number of recent samples kept per phase and counter (None keeps everything)
+        """
+        self.window = window
+        self.phases = {}
+        self.counters = {}
+        self.totals = {}
+
+    def phase(self, name):
+        """Context manager timing one occurrence of phase `name`."""
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = _Phase(self.window)
+        return phase
+
+    def count(self, name, value):
+        """Record this tick's value of counter `name`."""
+        samples = self.counters.get(name)
+        if samples is None:
+            samples = self.counters[name] = deque(maxlen=self.window)
+        samples.append(value)
+        self.totals[name] = self.totals.get(name, 0) + value
+
+    def reset(self):
+        self.phases.clear()
+        self.counters.clear()
+        self.totals.clear()
+
+    @staticmethod
+    def _stats(samples, percentiles):
+        # list() copies the deque in one step, so a simulation thread may keep appending
+        values = np.array(list(samples), dtype=np.float64)
+        stats = {"count": len(values), "mean": float(values.mean()) if len(values) else 0.0}
+        for q, value in zip(percentiles, np.percentile(values, percentiles) if len(values) else [0.0] * len(percentiles)):
+            stats[f"p{q}"] = float(value)
+        return stats
+
+    def summary(self, percentiles=PERCENTILES):
+        """
+        Statistics over the current window.
+        :return: Dict with "phases" (seconds) and "counters", each mapping a name to
+            count, mean and the requested percentiles; counters also carry their run total
+        """
+        # new names may be added from another thread while this runs
+        phases = {name: self._stats(phase.samples, percentiles) for name, phase in list(self.phases.items())}
+        counters = {}
+        for name, samples in list(self.counters.items()):
+            counters[name] = self._stats(samples, percentiles)
+            counters[name]["total"] = self.totals[name]
+        return {"phases": phases, "counters": counters}
+
+    def report_lines(self, percentiles=PERCENTILES):
+        """Human-readable summary, one phase or counter per line."""
+        summary = self.summary(percentiles)
+        header = "/".join(f"p{q}" for q in percentiles)
+        lines = []
+        for name, stats in summary["phases"].items():
+            values = " ".join(f"{stats[f'p{q}'] * 1e3:7.2f}" for q in percentiles)
+            lines.append(f"{name:16s} {values} ms ({header})")
+        for name, stats in summary["counters"].items():
+            values = " ".join(f"{stats[f'p{q}']:7.0f}" for q in percentiles)
+            lines.append(f"{name:16s} {values}    total {stats['total']}")
+        return lines
+
+    def export(self, path, series=True):
+        """
+        Write the summary, and optionally the raw samples, to a JSON file.
+        :param series: Include every retained sample of every phase and counter
+        """
+        data = self.summary()
+        if series:
+            data["series"] = {
+                "phases": {name: list(phase.samples) for name, phase in self.phases.items()},
+                "counters": {name: list(samples) for name, samples in self.counters.items()},
+            }
+        with open(path, "w") as f:
+            json.dump(data, f, default=int)
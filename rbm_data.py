@@ -0,0 +1,170 @@
+"""Bit-packed on-disk binary datasets streamed into RBM training."""
+
+import json
+import queue
+import threading
+
+import numpy as np
+
+
+class PackedWriter:
+    """
+    Append binary rows to a bit-packed file.
+
+    Rows are stored with np.packbits, one bit per feature, and the shape is kept in a
+    small JSON sidecar (`path + ".json"`) written on close.
+    """
+
+    def __init__(self, path, n_features):
+        self.path = path
+        self.n_features = n_features
+        self.n_rows = 0
+        self.file = open(path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, rows, packed=False):
+        """
+        Append rows to the file.
+        :param rows: (rows x n_features) array of 0/1 values
+        :param packed: The rows are already packed with np.packbits(axis=1)
+        """
+        rows = np.asarray(rows)
+        if not packed:
+            rows = np.packbits(rows.astype(bool), axis=1)
+        self.file.write(np.ascontiguousarray(rows).tobytes())
+        self.n_rows += len(rows)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        with open(self.path + ".json", "w") as f:
+            json.dump({"n_rows": self.n_rows, "n_features": self.n_features}, f)
+
+
+def packed_width(n_features):
+    return (n_features + 7) // 8
+
+
+def write_packed(path, data, chunk_rows=1 << 16):
+    """Write a binary array (or memmap) to `path` in bit-packed form, chunk by chunk."""
+    with PackedWriter(path, data.shape[1]) as writer:
+        for start in range(0, len(data), chunk_rows):
+            writer.write(data[start : start + chunk_rows])
+
+
+class Prefetcher:
+    """Run an iterator in a background thread, keeping up to `depth` items ready."""
+
+    _done = object()
+
+    def __init__(self, iterable, depth=2):
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(iterable,), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    return
+            self._put(self._done)
+        except BaseException as error:
+            self._put(error)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is self._done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self.stopped.set()
+
+
+class PackedDataset:
+    """
+    Memory-mapped reader for a file written by PackedWriter.
+
+    Indexing returns unpacked uint8 rows, so the dataset can stand in for an in-memory
+    array; batches() streams shuffled minibatches without loading the whole file.
+    """
+
+    def __init__(self, path):
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        self.n_features = meta["n_features"]
+        self.shape = (meta["n_rows"], self.n_features)
+        width = packed_width(self.n_features)
+        if meta["n_rows"]:
+            self.packed = np.memmap(path, dtype=np.uint8, mode="r", shape=(meta["n_rows"], width))
+        else:
+            self.packed = np.zeros((0, width), dtype=np.uint8)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def unpack(self, packed):
+        return np.unpackbits(packed, axis=1, count=self.n_features)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.unpack(self.packed[index : index + 1])[0]
+        return self.unpack(self.packed[index])
+
+    def _batches(self, batch_size, rng, shuffle, block_rows):
+        starts = np.arange(0, len(self), block_rows)
+        if shuffle:
+            rng.shuffle(starts)
+        leftover = None
+        for start in starts:
+            # contiguous reads, shuffled within each block
+            block = self.unpack(self.packed[start : start + block_rows])
+            if shuffle:
+                block = block[rng.permutation(len(block))]
+            if leftover is not None:
+                block = np.concatenate((leftover, block))
+            full = len(block) - len(block) % batch_size
+            for b in range(0, full, batch_size):
+                yield block[b : b + batch_size]
+            leftover = block[full:] if full < len(block) else None
+        if leftover is not None:
+            yield leftover
+
+    def batches(self, batch_size, rng=None, shuffle=True, block_rows=None, prefetch=2):
+        """
+        Yield unpacked minibatches covering the dataset once.
+        :param batch_size: Rows per batch (only the last batch may be smaller)
+        :param rng: np.random.Generator for the shuffling
+        :param shuffle: Visit blocks in random order and shuffle rows within each block
+        :param block_rows: Rows read from disk at a time (default: 64 batches)
+        :param prefetch: Batches prepared ahead in a background thread (0 to disable)
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        else:
+            # the prefetch thread gets its own stream so the caller can keep using rng
+            rng = rng.spawn(1)[0]
+        generator = self._batches(batch_size, rng, shuffle, block_rows or 64 * batch_size)
+        return iter(Prefetcher(generator, prefetch)) if prefetch else generator
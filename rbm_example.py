@@ -1,5 +1,6 @@
 import numpy as np
 import os
+from copula import CopulaSampler
 from models import RestrictedBoltzmannMachine
 import bindata as bd
 import matplotlib.pyplot as plt
@@ -15,31 +16,27 @@ def random_covariance_matrix(n):
     return covariance_matrix
 
 
-def gaussian_copula(n_samples, n_features, covariance_matrix, thresholds=None):
+def gaussian_copula(n_samples, n_features, covariance_matrix, thresholds=None, seed=None):
     """
     Generate correlated binary data using a Gaussian copula.
     :param n_samples: Number of samples to generate
     :param n_features: Number of binary features
     :param correlation_matrix: Correlation matrix (n_features x n_features)
     :param thresholds: Thresholds for binarization (default: 0 for all features)
+    :param seed: Seed for the Gaussian draws (default: drawn from np.random)
     :return: Correlated binary data (n_samples x n_features)
     """
-    # Step 1: Generate multivariate Gaussian data
-    mean = np.zeros(n_features)
-    gaussian_data = np.random.multivariate_normal(mean, covariance_matrix, size=n_samples)
-
-    # Step 2: Apply thresholds to convert to binary data
-    if thresholds is None:
-        thresholds = np.zeros(n_features)  # Default threshold is 0
-    binary_data = (gaussian_data > thresholds).astype(int)
-
-    return binary_data
+    if seed is None:
+        seed = np.random.randint(2**32)
+    return CopulaSampler(covariance_matrix[:n_features, :n_features], thresholds).sample(n_samples, seed)
 
 
 n_train = 1000  # Number of training samples
+n_validation = 200  # Number of held-out samples for early stopping
 n_visible = 6  # Number of visible units
 n_hidden = 3  # Number of hidden units
-epochs = 20000
+epochs = 2000
+batch_size = 100
 learning_rate = 0.01
 
 covariance_matrix = random_covariance_matrix(n_visible)
@@ -47,21 +44,32 @@ thresholds = np.random.rand(n_visible)
 print("Correlation Matrix:\n", covariance_matrix)
 print("Thresholds:\n", thresholds)
 
-sample_data = lambda n_samples: gaussian_copula(n_samples, n_visible, covariance_matrix, thresholds=thresholds)
+# factor the covariance once and reuse it for every draw
+sampler = CopulaSampler(covariance_matrix, thresholds)
+sample_data = lambda n_samples: sampler.sample(n_samples, seed=np.random.randint(2**32))
 
 training_data = sample_data(n_train)
+validation_data = sample_data(n_validation)
 
 # Initialize the RBM
 rbm = RestrictedBoltzmannMachine(n_visible, n_hidden, learning_rate)
 
 # Train the RBM using Contrastive Divergence
 input("Press Enter to start training...")
-for epoch in range(epochs):
-    rbm.contrastive_divergence(training_data, k=1)  # CD-1
-    # Calculate reconstruction error for monitoring
-    reconstructed_data = rbm.reconstruct(training_data)
-    error = np.mean((training_data - reconstructed_data) ** 2)
-    print(f"Epoch {epoch + 1}/{epochs}, Reconstruction Error: {error:.4f}")
+rbm.fit(
+    training_data,
+    epochs=epochs,
+    batch_size=batch_size,
+    k=1,  # CD-1
+    momentum=0.5,
+    eval_every=500,
+    eval_size=500,
+    validation_data=validation_data,
+    patience=10,
+    track_likelihood=True,
+    verbose=True,
+)
+print(f"Validation log-likelihood: {rbm.log_likelihood(validation_data):.4f}")
 
 # Test the RBM by reconstructing some data
 n_test = 5  # Number of test samples
@@ -0,0 +1,404 @@
+"""Batched pygame renderer for AgentGraph with cached labels and dirty-rect updates."""
+
+from collections import OrderedDict
+from itertools import repeat
+
+import numpy as np
+import pygame
+
+from simulation import COLORS, MAGENTA, RED
+from spatial import SpatialGrid
+
+BACKGROUND_COLOR = np.ones(3) * 50
+AGENT_RADIUS = 10
+LABEL_MARGIN = 60  # pixels around the screen in which agents are still drawn, so their labels can reach in
+# density colors at 0, 1/3, 2/3 and all of the log-scaled maximum count
+HEAT_STOPS = np.array([0.0, 1 / 3, 2 / 3, 1.0])
+HEAT_COLORS = np.array([BACKGROUND_COLOR, (160, 30, 60), (250, 150, 20), (255, 255, 220)])
+# odd 64-bit constants mixing an (i, j) pair into a score, for picking which quiet edges to draw
+EDGE_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xBF58476D1CE4E5B9))
+
+
+def opposite_color(rbg):
+    return tuple(255 - x for x in rbg)
+
+
+class LabelCache:
+    """Least-recently-used cache of rendered label surfaces."""
+
+    def __init__(self, font, max_size=10_000):
+        self.font = font
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.profiler = None  # optional profiling.Profiler, times font.render
+
+    def get(self, name, resources, color):
+        key = (name, resources, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        if self.profiler is None:
+            surface = self.font.render(name + " " + str(resources), True, opposite_color(color))
+        else:
+            with self.profiler.phase("font.render"):
+                surface = self.font.render(name + " " + str(resources), True, opposite_color(color))
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+class Camera:
+    """
+    Maps world coordinates to screen pixels: the world point `center` appears in the middle
+    of the screen, magnified `zoom` times. On a torus every agent is drawn at its image
+    nearest to the center, so panning across an edge wraps around.
+    """
+
+    def __init__(self, screen_size, center=None, zoom=1.0, min_zoom=1e-3, max_zoom=16.0):
+        """
+        :param screen_size: (width, height) of the screen in pixels
+        :param center: World point shown in the middle (default: the middle of the screen, i.e. no offset)
+        :param zoom: Pixels per world unit
+        """
+        self.half = np.array(screen_size, dtype=np.float64) / 2
+        self.center = self.half.copy() if center is None else np.array(center, dtype=np.float64)
+        self.zoom = zoom
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+    @property
+    def state(self):
+        return (*self.center.tolist(), self.zoom)
+
+    def fit(self, width, height):
+        """Show the whole of a width x height world."""
+        self.center = np.array([width, height], dtype=np.float64) / 2
+        self.zoom = min(self.half[0] * 2 / width, self.half[1] * 2 / height)
+
+    def to_screen(self, world, loc):
+        """Screen positions of world positions `loc`."""
+        return self.half + world.displacement(self.center, loc) * self.zoom
+
+    def to_world(self, pos):
+        """World position under screen position `pos` (not wrapped)."""
+        return self.center + (np.asarray(pos, dtype=np.float64) - self.half) / self.zoom
+
+    def view(self, margin=0):
+        """(lo, hi) corners of the visible part of the world, widened by `margin` pixels."""
+        extent = (self.half + margin) / self.zoom
+        return self.center - extent, self.center + extent
+
+    def pan(self, dx, dy):
+        """Move the picture by (dx, dy) pixels."""
+        self.center -= np.array([dx, dy], dtype=np.float64) / self.zoom
+
+    def zoom_at(self, factor, pos=None):
+        """Zoom by `factor`, keeping the world point under screen position `pos` in place."""
+        pos = self.half if pos is None else np.asarray(pos, dtype=np.float64)
+        anchor = self.to_world(pos)
+        self.zoom = float(np.clip(self.zoom * factor, self.min_zoom, self.max_zoom))
+        self.center = anchor - (pos - self.half) / self.zoom
+
+
+class Renderer:
+    """
+    Draw an AgentGraph onto a surface through a Camera.
+
+    Only agents inside the viewport are drawn, found with a SpatialGrid once the view
+    shows less than the whole world; the grid is rebuilt only after the agents moved more
+    than a cell since it was built. Agents are blitted from one pre-rendered circle sprite
+    per color, labels come from a LabelCache and are left out when zoomed far out, and only
+    edges touching a visible agent are drawn: every traded one, and quiet pairs that are
+    merely in range only up to `max_edges` edges in total. With more than `max_agents` agents
+    or `max_traded` traded edges in view the frame becomes a density map instead: visible
+    agents are counted per block of pixels and the counts are blitted as one surface. With
+    `dirty` set, each frame erases just the rectangles touched by the previous one and
+    present() pushes only the changed rectangles to the display.
+    """
+
+    def __init__(
+        self,
+        screen,
+        font,
+        label_cache_size=10_000,
+        dirty=True,
+        max_dirty_rects=2_000,
+        camera=None,
+        max_agents=5_000,
+        label_zoom=0.5,
+        density_cell=4,
+        max_edges=2_000,
+        max_traded=20_000,
+    ):
+        """
+        :param screen: Target surface
+        :param font: pygame font for the agent labels
+        :param label_cache_size: Number of label surfaces kept around
+        :param dirty: Update only the changed rectangles instead of the whole screen
+        :param max_dirty_rects: Above this many rectangles a full update is cheaper
+        :param camera: Camera (default: world coordinates are screen pixels)
+        :param max_agents: Above this many agents in view draw the density map
+        :param label_zoom: Draw labels only at this zoom or closer
+        :param density_cell: Edge in pixels of the blocks counted by the density map
+        :param max_edges: Edge budget per frame; traded edges are drawn beyond it, quiet ones fill what is left
+        :param max_traded: Above this many traded edges in view draw the density map
+        """
+        self.screen = screen
+        self.labels = LabelCache(font, label_cache_size)
+        self.sprites = {}
+        self.dirty = dirty
+        self.max_dirty_rects = max_dirty_rects
+        self.camera = Camera(screen.get_size()) if camera is None else camera
+        self.max_agents = max_agents
+        self.label_zoom = label_zoom
+        self.density_cell = density_cell
+        self.max_edges = max_edges
+        self.max_traded = max_traded
+        self.grid = None
+        self._binned = None  # positions the grid was built from
+        self.previous = None  # rectangles drawn on the last frame, None = unknown
+        self.rects = None  # rectangles to push to the display, None = everything
+        self.edges_drawn = 0
+        self.visible = 0  # agents in view on the last frame
+        self.density = False  # whether the last frame was a density map
+        self._camera_state = None
+        self._profiler = None
+
+    @property
+    def profiler(self):
+        """Optional profiling.Profiler timing the drawing phases."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
+        self.labels.profiler = profiler
+
+    def sprite(self, color):
+        surface = self.sprites.get(color)
+        if surface is None:
+            size = 2 * AGENT_RADIUS
+            surface = pygame.Surface((size, size))
+            key = opposite_color(color)
+            surface.fill(key)
+            surface.set_colorkey(key)
+            pygame.draw.circle(surface, color, (AGENT_RADIUS, AGENT_RADIUS), AGENT_RADIUS)
+            self.sprites[color] = surface
+        return surface
+
+    def clear(self):
+        """Erase what the previous frame drew. Returns True if the whole screen was cleared."""
+        if not self.dirty or self.previous is None:
+            self.screen.fill(BACKGROUND_COLOR)
+            return True
+        for rect in self.previous:
+            self.screen.fill(BACKGROUND_COLOR, rect)
+        return False
+
+    def cull(self, world):
+        """Slots of the living agents in view, widened by LABEL_MARGIN."""
+        lo, hi = self.camera.view(LABEL_MARGIN)
+        if np.all(hi - lo >= world.bounds) or (not world.torus and np.all(lo <= 0) and np.all(hi >= world.bounds)):
+            return world.live()
+        grid, drift = self.grid, np.inf
+        if grid is None or (grid.width, grid.height, grid.torus) != (world.width, world.height, world.torus):
+            # a fixed number of cells keeps building cheap whatever the zoom
+            grid = self.grid = SpatialGrid(world.width, world.height, max(world.width, world.height) / 64, world.torus)
+        elif len(self._binned) == len(world):
+            # instead of binning every frame, widen the view by how far any agent got from its cell
+            moved = np.abs(world.loc - self._binned)
+            drift = moved.max(initial=0.0)
+            if world.torus and drift > min(grid.cell_w, grid.cell_h):
+                # maybe just across the edge
+                drift = np.minimum(moved, world.bounds - moved).max()
+        if drift > min(grid.cell_w, grid.cell_h):
+            self._binned = world.loc.copy()
+            grid.build(self._binned)
+            drift = 0.0
+        visible = grid.in_rect(lo - drift, hi + drift)
+        if world.n_free:
+            visible = visible[world.alive[visible]]
+        return visible
+
+    def crowded(self, graph, visible):
+        """Whether the view holds too many agents or traded edges to draw them one by one."""
+        if len(visible) > self.max_agents:
+            return True
+        trades = graph.trades
+        if trades is None or len(trades.i) <= self.max_traded:
+            return False
+        shown = np.zeros(len(graph.world), dtype=bool)
+        shown[visible] = True
+        return np.count_nonzero(shown[trades.i] | shown[trades.j]) > self.max_traded
+
+    def draw_edges(self, graph, flicker, visible=None):
+        world, camera = graph.world, self.camera
+        loc, n = world.loc, len(world)
+        i, j = graph.pairs
+        shown = np.ones(n, dtype=bool)
+        if visible is not None and len(visible) < n:
+            shown[:] = False
+            shown[visible] = True
+            keep = shown[i] | shown[j]
+            i, j = i[keep], j[keep]
+        partner = world.trading_with
+        movers = np.flatnonzero((partner >= 0) & shown)
+        movers = movers[world.alive[partner[movers]]]  # the partner may have been despawned since
+        traded = np.zeros(len(i), dtype=bool)
+        if graph.trades is not None and len(graph.trades.i):
+            # pairs are sorted by (i, j), so the traded ones can be found by bisection
+            key = i * n + j
+            target = graph.trades.i * n + graph.trades.j
+            found = np.searchsorted(key, target)
+            hit = found < len(key)
+            hit[hit] = key[found[hit]] == target[hit]
+            traded[found[hit]] = True
+        quiet, busy = np.flatnonzero(~traded), np.flatnonzero(traded)
+        if len(movers) and len(busy):
+            # the thick line to the current partner covers the traded edge underneath
+            ends = np.sort(np.stack((movers, partner[movers])), axis=0)
+            busy = busy[~np.isin(i[busy] * n + j[busy], ends[0] * n + ends[1])]
+        budget = max(self.max_edges - len(busy) - len(movers), 0)
+        if len(quiet) > budget:
+            # the lowest scores of a fixed hash of the pair, so the same quiet edges stay on screen
+            score = (i[quiet].astype(np.uint64) * EDGE_MIX[0] ^ j[quiet].astype(np.uint64)) * EDGE_MIX[1]
+            quiet = quiet[np.argpartition(score, budget)[:budget]] if budget else quiet[:0]
+
+        # draw toward the nearest image of the partner so edges do not cross the screen
+        a = np.concatenate((i[quiet], i[busy], movers))
+        b = np.concatenate((j[quiet], j[busy], partner[movers]))
+        start = camera.to_screen(world, loc[a])
+        end = (start + world.displacement(loc[a], loc[b]) * camera.zoom).tolist()
+        start = start.tolist()
+        n_quiet, n_busy = len(quiet), len(quiet) + len(busy)
+        if flicker:
+            colors = [COLORS[c] for c in np.random.randint(len(COLORS), size=n_quiet)]
+        else:
+            colors = repeat(tuple(int(c) for c in BACKGROUND_COLOR + (10, 10, 10)))
+        line, screen = pygame.draw.line, self.screen
+        rects = list(map(line, repeat(screen), colors, start[:n_quiet], end[:n_quiet]))
+        rects.extend(map(line, repeat(screen), repeat(MAGENTA), start[n_quiet:n_busy], end[n_quiet:n_busy], repeat(3)))
+        rects.extend(map(line, repeat(screen), repeat(RED), start[n_busy:], end[n_busy:], repeat(5)))
+        self.edges_drawn = len(rects)
+        return rects
+
+    def draw_agents(self, graph, visible=None):
+        world = graph.world
+        if visible is None:
+            visible = world.live()
+        centers = np.rint(self.camera.to_screen(world, world.loc[visible])).astype(int).tolist()
+        colors = [tuple(c) for c in world.color[visible].tolist()]
+        blits = []
+        if self.camera.zoom < self.label_zoom:
+            for (x, y), color in zip(centers, colors):
+                blits.append((self.sprite(color), (x - AGENT_RADIUS, y - AGENT_RADIUS)))
+            return self.screen.blits(blits, doreturn=True)
+        names = world.names
+        resources = [tuple(r) for r in world.resources[visible].tolist()]
+        for slot, (x, y), color, held in zip(visible.tolist(), centers, colors, resources):
+            blits.append((self.sprite(color), (x - AGENT_RADIUS, y - AGENT_RADIUS)))
+            label = self.labels.get(names[slot], held, color)
+            w, h = label.get_size()
+            blits.append((label, (x - w // 2, y - h // 2)))
+        return self.screen.blits(blits, doreturn=True)
+
+    def draw_density(self, graph, visible):
+        """Fill the screen with a heat map of the number of agents per density_cell block."""
+        world, cell = graph.world, self.density_cell
+        self.edges_drawn = 0
+        width, height = self.screen.get_size()
+        cols, rows = -(-width // cell), -(-height // cell)
+        pos = (self.camera.to_screen(world, world.loc[visible]) // cell).astype(np.int64)
+        inside = (pos[:, 0] >= 0) & (pos[:, 0] < cols) & (pos[:, 1] >= 0) & (pos[:, 1] < rows)
+        pos = pos[inside]
+        # x-major, the layout pygame.surfarray expects
+        counts = np.bincount(pos[:, 0] * rows + pos[:, 1], minlength=cols * rows).reshape(cols, rows)
+        level = np.log1p(counts) / np.log1p(max(counts.max(), 1))
+        pixels = np.stack([np.interp(level, HEAT_STOPS, HEAT_COLORS[:, c]) for c in range(3)], axis=-1).astype(np.uint8)
+        surface = pygame.surfarray.make_surface(pixels)
+        if cell != 1:
+            surface = pygame.transform.scale(surface, (cols * cell, rows * cell))
+        return [self.screen.blit(surface, (0, 0))]
+
+    def draw(self, graph, flicker=False):
+        """Draw one frame and return the list of rectangles it touched."""
+        profiler = self.profiler
+        if self.camera.state != self._camera_state:
+            # everything moved on screen
+            self._camera_state = self.camera.state
+            self.previous = None
+        if profiler is None:
+            visible = self.cull(graph.world)
+            self.visible = len(visible)
+            self.density = self.crowded(graph, visible)
+            if self.density:
+                rects = self.draw_density(graph, visible)
+                full = True
+            else:
+                full = self.clear()
+                rects = self.draw_edges(graph, flicker, visible)
+                rects.extend(self.draw_agents(graph, visible))
+        else:
+            misses = self.labels.misses
+            with profiler.phase("cull"):
+                visible = self.cull(graph.world)
+            self.visible = len(visible)
+            self.density = self.crowded(graph, visible)
+            if self.density:
+                with profiler.phase("draw_density"):
+                    rects = self.draw_density(graph, visible)
+                full = True
+            else:
+                with profiler.phase("clear"):
+                    full = self.clear()
+                with profiler.phase("draw_edges"):
+                    rects = self.draw_edges(graph, flicker, visible)
+                with profiler.phase("draw_agents"):
+                    rects.extend(self.draw_agents(graph, visible))
+            profiler.count("agents_visible", self.visible)
+            profiler.count("edges_drawn", self.edges_drawn)
+            profiler.count("labels_rendered", self.labels.misses - misses)
+        if self.density:
+            # the next frame has to paint over the whole map
+            self.rects, self.previous = None, None
+            return rects
+        if full or len(rects) + len(self.previous) > self.max_dirty_rects:
+            self.rects = None
+        else:
+            self.rects = rects + self.previous
+        self.previous = rects if len(rects) <= self.max_dirty_rects else None
+        return rects
+
+    def draw_text(self, lines, font, topleft=(5, 5), color=(255, 255, 255), background=(0, 0, 0)):
+        """
+        Draw a block of text lines on an opaque box, e.g. the profiling overlay.
+        The box is added to the dirty rectangles of the current and the next frame.
+        """
+        surfaces = [font.render(line, True, color) for line in lines]
+        if not surfaces:
+            return None
+        width = max(s.get_width() for s in surfaces) + 6
+        height = sum(s.get_height() for s in surfaces) + 6
+        rect = self.screen.fill(background, pygame.Rect(topleft, (width, height)))
+        y = topleft[1] + 3
+        for surface in surfaces:
+            self.screen.blit(surface, (topleft[0] + 3, y))
+            y += surface.get_height()
+        if self.rects is not None:
+            self.rects.append(rect)
+        if self.previous is not None:
+            self.previous.append(rect)
+        return rect
+
+    def present(self):
+        """Push the last frame to the display."""
+        if self.rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self.rects)
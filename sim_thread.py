@@ -0,0 +1,157 @@
+"""Run the simulation in a background thread and hand double-buffered snapshots to the renderer."""
+
+import threading
+import time
+
+import numpy as np
+
+from simulation import AgentGraph
+
+
+class Snapshot:
+    """State of the world after one tick, as needed to draw it."""
+
+    __slots__ = ("tick", "time", "loc", "resources", "trading_with", "pairs", "trades", "winner", "population")
+
+    def __init__(self, n_agents, n_resources):
+        self.tick = -1
+        self.time = 0.0  # perf_counter() when the tick finished
+        self.loc = np.zeros((n_agents, 2))
+        self.resources = np.zeros((n_agents, n_resources), dtype=np.int64)
+        self.trading_with = np.full(n_agents, -1, dtype=np.int64)
+        self.pairs = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        self.trades = None
+        self.winner = None  # name of the winner once there is one
+        self.population = None  # (names, arrays) copied whenever agents are added or removed
+
+    def copy_from(self, other):
+        if len(self.loc) != len(other.loc):
+            self.__init__(len(other.loc), other.resources.shape[1])
+        self.tick, self.time = other.tick, other.time
+        self.loc[...] = other.loc
+        self.resources[...] = other.resources
+        self.trading_with[...] = other.trading_with
+        # pairs and trades are fresh arrays every tick and never modified, so they can be shared
+        self.pairs, self.trades = other.pairs, other.trades
+        self.winner, self.population = other.winner, other.population
+
+
+class SimulationThread(threading.Thread):
+    """
+    Advance an AgentGraph as fast as allowed, independently of the frame rate.
+
+    After every tick the worker fills the back buffer and swaps it with the front one under
+    a lock. The renderer calls snapshots() at its own pace and gets private copies of the two
+    most recent ticks it has seen, so it can interpolate between them while the worker keeps
+    writing. The worker owns the graph while it runs; read it only from snapshots.
+    """
+
+    def __init__(self, graph, tick_rate=None):
+        """
+        :param graph: AgentGraph to simulate
+        :param tick_rate: Maximum ticks per second (None runs unthrottled)
+        """
+        super().__init__(daemon=True)
+        self.graph = graph
+        self.tick_rate = tick_rate
+        self.stopped = threading.Event()
+        self.error = None
+        self._lock = threading.Lock()
+        self._version = 0
+        n, n_resources = len(graph.world), graph.world.n_resources
+        self._front, self._back = Snapshot(n, n_resources), Snapshot(n, n_resources)
+        self._previous, self._current = Snapshot(n, n_resources), Snapshot(n, n_resources)
+        self._seen = -1
+        self._population = None
+        self._population_version = -1
+        self._publish(None)
+
+    def run(self):
+        interval = 1 / self.tick_rate if self.tick_rate else 0.0
+        next_tick = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                self.graph.update()
+                winner = self.graph.check_for_winner()
+                self._publish(winner.name if winner is not None else None)
+                if winner is not None:
+                    return
+                if interval:
+                    next_tick = max(next_tick + interval, time.perf_counter() - interval)
+                    self.stopped.wait(max(0.0, next_tick - time.perf_counter()))
+        except Exception as error:
+            self.error = error
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.join(timeout)
+
+    def _publish(self, winner):
+        graph, world = self.graph, self.graph.world
+        if world.population_version != self._population_version:
+            self._population = (list(world.names), {field: array.copy() for field, array in world.arrays().items()})
+            self._population_version = world.population_version
+        back = self._back
+        if len(back.loc) != len(world):
+            back.__init__(len(world), world.n_resources)
+        back.tick, back.time = graph.tick, time.perf_counter()
+        back.loc[...] = world.loc
+        back.resources[...] = world.resources
+        back.trading_with[...] = world.trading_with
+        back.pairs, back.trades = graph.pairs, graph.trades
+        back.winner, back.population = winner, self._population
+        with self._lock:
+            self._front, self._back = back, self._front
+            self._version += 1
+
+    def snapshots(self):
+        """
+        Return (previous, current): private copies of the two latest ticks seen by this reader.
+        Raises the worker's exception if the simulation failed.
+        """
+        if self.error is not None:
+            raise self.error
+        with self._lock:
+            if self._version != self._seen:
+                self._previous, self._current = self._current, self._previous
+                self._current.copy_from(self._front)
+                if self._seen < 0 or len(self._previous.loc) != len(self._current.loc):
+                    self._previous.copy_from(self._current)
+                self._seen = self._version
+        return self._previous, self._current
+
+
+class InterpolatedView:
+    """
+    An AgentGraph used only for drawing, filled from snapshots.
+
+    Positions are blended between the previous and the current tick according to how much
+    time has passed since the current one arrived, so motion stays smooth when the tick rate
+    and the frame rate differ; everything else shows the current tick.
+    """
+
+    def __init__(self, config):
+        self.graph = AgentGraph(config=config)
+        self._population = None
+
+    def update(self, previous, current, now=None):
+        """
+        :param now: perf_counter() of the frame (default: now)
+        :return: The graph, ready to be drawn
+        """
+        graph, world = self.graph, self.graph.world
+        if current.population is not self._population:
+            names, arrays = current.population
+            world.load_arrays(names, {field: array.copy() for field, array in arrays.items()})
+            self._population = current.population
+        if now is None:
+            now = time.perf_counter()
+        interval = current.time - previous.time
+        alpha = min(max((now - current.time) / interval, 0.0), 1.0) if interval > 0 else 1.0
+        # blend along the shortest way around the torus
+        world.loc[...] = world.wrap(previous.loc + alpha * world.displacement(previous.loc, current.loc))
+        world.resources[...] = current.resources
+        world.resources_changed()
+        world.trading_with[...] = current.trading_with
+        graph.pairs, graph.trades, graph.tick = current.pairs, current.trades, current.tick
+        return graph
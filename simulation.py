@@ -0,0 +1,613 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from names import generate_names, generate_random_name
+from spatial import SpatialGrid
+from world import World
+import random
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+BLUE = (0, 0, 255)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+ORANGE = (255, 165, 0)
+YELLOW = (255, 255, 0)
+PURPLE = (128, 0, 128)
+CYAN = (0, 255, 255)
+MAGENTA = (255, 0, 255)
+COLORS = [WHITE, BLACK, BLUE, RED, GREEN, ORANGE, YELLOW, PURPLE, CYAN, MAGENTA]
+
+WIDTH = 720
+HEIGHT = 1280
+TORUS = True
+
+RESOURCE_LIST = ["dew", "bast", "sap"]
+RESOURCE_INDEX = {r: i for i, r in enumerate(RESOURCE_LIST)}
+
+N_AGENTS = 20
+
+STEPRATE_DEFAULT = 0.5
+STEPSIZE_DEFAULT = 5
+TURN_VARIANCE_DEFAULT = 0.4
+TRADE_DISTANCE_DEFAULT = 100
+TRADE_UNITS = 2  # most a partner hands over of a wanted resource per tick
+WIN_AMOUNT_DEFAULT = 50
+
+
+@dataclass
+class SimConfig:
+    """Per-run simulation parameters. The defaults are the module-level constants."""
+
+    n_agents: int = N_AGENTS
+    width: float = WIDTH
+    height: float = HEIGHT
+    torus: bool = TORUS
+    steprate: float = STEPRATE_DEFAULT
+    stepsize: float = STEPSIZE_DEFAULT
+    turn_variance: float = TURN_VARIANCE_DEFAULT
+    trade_distance: float = TRADE_DISTANCE_DEFAULT
+    win_amount: int = WIN_AMOUNT_DEFAULT
+
+
+def make_name(sylb=3, rng=random):
+    return generate_random_name(sylb, rng=rng)
+
+
+def choose_random_other(lst, item):
+    return random.choice([x for x in lst if x != item])
+
+
+def make_world(capacity=N_AGENTS, seed=None, config=None):
+    if config is None:
+        config = SimConfig()
+    return World(
+        config.width,
+        config.height,
+        torus=config.torus,
+        n_resources=len(RESOURCE_LIST),
+        capacity=capacity,
+        seed=seed,
+    )
+
+
+class Resources(dict):
+    def __init__(self):
+        super().__init__()
+        for resource in RESOURCE_LIST:
+            self[resource] = 0
+
+    def __str__(self):
+        return ", ".join([str(v) + " " + k for k, v in self.items()])
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __add__(self, other):
+        result = Resources()
+        for k in self.keys():
+            result[k] = self[k] + other[k]
+        return result
+
+    def __sub__(self, other):
+        result = Resources()
+        for k in self.keys():
+            result[k] = self[k] - other[k]
+        return result
+
+    def randomize(self):
+        for k in self.keys():
+            self[k] = np.random.randint(0, 10)
+
+    def get_tuple(self):
+        return (self["dew"], self["bast"], self["sap"])
+
+    @classmethod
+    def from_tuple(cls, values):
+        result = cls()
+        for k, v in zip(RESOURCE_LIST, values):
+            result[k] = int(v)
+        return result
+
+
+class ResourcesView:
+    """Dict-like view onto one agent's row of the world resource matrix."""
+
+    __slots__ = ("agent",)
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    @property
+    def _row(self):
+        return self.agent.world._buffers["resources"][self.agent.index]
+
+    def __getitem__(self, key):
+        return int(self._row[RESOURCE_INDEX[key]])
+
+    def __setitem__(self, key, value):
+        self._row[RESOURCE_INDEX[key]] = value
+        self.agent.world.resources_changed()
+
+    def __iter__(self):
+        return iter(RESOURCE_LIST)
+
+    def __len__(self):
+        return len(RESOURCE_LIST)
+
+    def keys(self):
+        return list(RESOURCE_LIST)
+
+    def values(self):
+        return [int(v) for v in self._row]
+
+    def items(self):
+        return list(zip(RESOURCE_LIST, self.values()))
+
+    def __str__(self):
+        return ", ".join([str(v) + " " + k for k, v in self.items()])
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __add__(self, other):
+        return Resources.from_tuple(self.get_tuple()) + other
+
+    def __sub__(self, other):
+        return Resources.from_tuple(self.get_tuple()) - other
+
+    def randomize(self):
+        self._row[:] = np.random.randint(0, 10, len(RESOURCE_LIST))
+        self.agent.world.resources_changed()
+
+    def get_tuple(self):
+        return tuple(self.values())
+
+
+class Agent:
+    """
+    Lightweight view onto one slot of a World.
+
+    A freshly constructed agent lives in its own single-slot world until it is added to an
+    AgentGraph, which copies its state into the shared arrays and rebinds the view.
+    """
+
+    __slots__ = ("world", "index")
+
+    def __init__(
+        self,
+        name,
+        loc=np.array([0, 0]),
+        bearing=0.0,
+        color=None,
+        steprate=STEPRATE_DEFAULT,  # ratio
+        stepsize=STEPSIZE_DEFAULT,  # int
+        turn_variance=TURN_VARIANCE_DEFAULT,
+    ):
+        self.world = make_world(capacity=1)
+        self.index = self.world.add(
+            name,
+            loc=loc,
+            bearing=bearing,
+            color=random.choice(COLORS) if color is None else color,
+            steprate=steprate,
+            stepsize=stepsize,
+            turn_variance=turn_variance,
+        )
+        self.resources.randomize()
+        self.want = random.choice(RESOURCE_LIST)
+
+    @classmethod
+    def view(cls, world, index):
+        """Return a view onto an existing world slot without copying any state."""
+        agent = cls.__new__(cls)
+        agent.world = world
+        agent.index = index
+        return agent
+
+    def attach(self, world):
+        """Move this agent's state into `world` and point the view at its new slot."""
+        if world is not self.world:
+            self.index = world.copy_from(self.world, self.index)
+            self.world = world
+
+    def __eq__(self, other):
+        return isinstance(other, Agent) and self.world is other.world and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.world), self.index))
+
+    def _field(self, field):
+        return self.world._buffers[field]
+
+    @property
+    def name(self):
+        return self.world.names[self.index]
+
+    @property
+    def loc(self):
+        return self._field("loc")[self.index]
+
+    @loc.setter
+    def loc(self, value):
+        self._field("loc")[self.index] = value
+
+    @property
+    def bearing(self):
+        return float(self._field("bearing")[self.index])
+
+    @bearing.setter
+    def bearing(self, value):
+        self._field("bearing")[self.index] = value
+
+    @property
+    def color(self):
+        return tuple(int(c) for c in self._field("color")[self.index])
+
+    @color.setter
+    def color(self, value):
+        self._field("color")[self.index] = value
+
+    @property
+    def resources(self):
+        return ResourcesView(self)
+
+    @property
+    def want(self):
+        return RESOURCE_LIST[self._field("want")[self.index]]
+
+    @want.setter
+    def want(self, value):
+        self._field("want")[self.index] = RESOURCE_INDEX[value]
+
+    @property
+    def trading_with(self):
+        other = self._field("trading_with")[self.index]
+        return None if other < 0 else Agent.view(self.world, int(other))
+
+    @trading_with.setter
+    def trading_with(self, value):
+        self._field("trading_with")[self.index] = -1 if value is None else value.index
+
+    @property
+    def steprate(self):
+        return float(self._field("steprate")[self.index])
+
+    @steprate.setter
+    def steprate(self, value):
+        self._field("steprate")[self.index] = value
+
+    @property
+    def stepsize(self):
+        return float(self._field("stepsize")[self.index])
+
+    @stepsize.setter
+    def stepsize(self, value):
+        self._field("stepsize")[self.index] = value
+
+    @property
+    def turn_variance(self):
+        return float(self._field("turn_variance")[self.index])
+
+    @turn_variance.setter
+    def turn_variance(self, value):
+        self._field("turn_variance")[self.index] = value
+
+    def step(self, step=np.array([0, 0])):
+        self.world.move(self.index, step)
+
+    def __str__(self):
+        """print all properties"""
+        out = []
+        out.append(f"name\t{self.name}")
+        out.append(f"loc\t{self.loc}")
+        out.append(f"color\t{self.color}")
+        out.append(f"resources\t{self.resources}")
+        out.append(f"trading_with\t{self.trading_with.name if self.trading_with is not None else None}")
+        out.append(f"want\t{self.want}")
+        return "\n".join(out)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class AgentViews(Sequence):
+    """
+    Agents of a World as a sequence of Agent views that are made on access, so no per-agent
+    object is kept around.
+    """
+
+    __slots__ = ("world", "_slots")
+
+    def __init__(self, world, slots=None):
+        """
+        :param world: World the agents live in
+        :param slots: Slots in the sequence (default: the living agents, looked up on every use)
+        """
+        self.world = world
+        self._slots = slots
+
+    @property
+    def slots(self):
+        return self.world.live() if self._slots is None else self._slots
+
+    def __len__(self):
+        return self.world.n_alive if self._slots is None else len(self._slots)
+
+    def __getitem__(self, key):
+        slots = self.slots
+        if isinstance(key, slice):
+            return AgentViews(self.world, slots[key])
+        return Agent.view(self.world, int(slots[key]))
+
+    def __iter__(self):
+        world = self.world
+        return (Agent.view(world, slot) for slot in self.slots.tolist())
+
+    def __contains__(self, agent):
+        if not isinstance(agent, Agent) or agent.world is not self.world:
+            return False
+        if self._slots is None:
+            return 0 <= agent.index < self.world.size and bool(self.world.alive[agent.index])
+        return bool(np.any(self._slots == agent.index))
+
+    def __call__(self):
+        # graph.nodes() works as well as graph.nodes
+        return self
+
+
+class AgentGraph:
+    """
+    The agents of one run and the trading between them.
+
+    The agent state lives in `world`; `nodes` makes Agent views of the living agents on
+    demand instead of keeping a registry of them.
+    """
+
+    def __init__(self, agents=None, seed=None, config=None):
+        self.config = SimConfig() if config is None else config
+        self.world = make_world(seed=seed, config=self.config)  # per-agent state, one array per field
+        self.trade_distance = self.config.trade_distance
+        self.pairs = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))  # agents in trade range
+        self.trades = None  # outcome of the last do_trades
+        self.tick = 0
+        self.recorder = None  # optional trade_log.TradeRecorder
+        self.frame_recorder = None  # optional checkpoint.FrameRecorder
+        self.verbose = False  # print every trade to the console
+        self.profiler = None  # optional profiling.Profiler
+        self.network = None  # optional trade_network.TradeNetwork
+        self.stats = None  # optional wealth_stats.WealthStats
+        if agents is not None:
+            for agent in agents:
+                self.add_agent(agent)
+
+    def add_agent(self, agent):
+        agent.attach(self.world)
+        if self.stats is not None:
+            self.stats.add(np.array([agent.index]))
+
+    def add_agents(self, names, **fields):
+        """
+        Add a batch of agents straight into the world arrays.
+        :param names: List of agent names
+        :param fields: Per-agent arrays, see World.FIELDS
+        :return: Sequence of Agent views of the new agents
+        """
+        slots = self.world.extend(names, **fields)
+        return AgentViews(self.world, np.arange(slots.start, slots.stop))
+
+    def spawn(self, n, names=None, rng=None, **fields):
+        """
+        Add a cohort of agents at once, reusing the slots of despawned ones.
+        Names, positions, colors, wants and resources not given are drawn in bulk.
+        :param n: Number of agents
+        :param names: List of names (default: generated, distinct from each other and from the names in the world)
+        :param rng: np.random.Generator for the random fields (default: the world's generator)
+        :param fields: Per-agent arrays (or scalars) overriding the random ones, see World.FIELDS
+        :return: Array of the new agents' slots
+        """
+        rng = self.world.rng if rng is None else rng
+        names, cohort = random_cohort(n, rng, self.config, names=names, exclude=self.world.names_in_use)
+        cohort.update(fields)
+        slots = self.world.spawn(names, **cohort)
+        if self.stats is not None:
+            self.stats.add(slots)
+        return slots
+
+    def despawn(self, slots):
+        """
+        Remove agents, e.g. the ones that went bankrupt; their resources leave the game.
+        :param slots: Slots (or Agent views) of living agents
+        """
+        slots = np.array([s.index if isinstance(s, Agent) else s for s in slots], dtype=np.int64)
+        slots, removed = self.world.despawn(slots)
+        if self.stats is not None:
+            self.stats.remove(slots, removed)
+
+    @property
+    def nodes(self):
+        """The living agents, as Agent views made on access."""
+        return AgentViews(self.world)
+
+    def __len__(self):
+        return self.world.n_alive
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, agent):
+        return agent in self.nodes
+
+    def __str__(self):
+        out = "Agents:\n"
+        if len(self.nodes) == 0:
+            out += "None"
+        else:
+            out += "\n".join([str(agent) for agent in self.nodes])
+        return out
+
+    def __repr__(self):
+        return self.__str__()
+
+    def distance(self, agent1, agent2):
+        return np.linalg.norm(self.world.displacement(agent1.loc, agent2.loc))
+
+    def find_pairs(self):
+        """Return index arrays (i, j) of all agent pairs closer than the trade distance, and their distances."""
+        world = self.world
+        grid = SpatialGrid(world.width, world.height, self.trade_distance, torus=world.torus)
+        if world.n_free == 0:
+            pairs = grid.build(world.loc).pairs(self.trade_distance)
+        else:
+            # leave the dead slots out; mapping back keeps the pairs sorted by (i, j)
+            live = world.live()
+            i, j, dist = grid.build(world.loc[live]).pairs(self.trade_distance)
+            pairs = live[i], live[j], dist
+        if self.profiler is not None:
+            self.profiler.count("pairs_checked", grid.checked)
+            self.profiler.count("pairs_in_range", len(pairs[0]))
+        return pairs
+
+    @property
+    def traded_edges(self):
+        """Agent pairs that traded on the last tick."""
+        if self.trades is None:
+            return set()
+        return {(Agent.view(self.world, int(i)), Agent.view(self.world, int(j))) for i, j in zip(self.trades.i, self.trades.j)}
+
+    def near_edges(self):
+        """Yield the agent pairs found in trade range on the last tick."""
+        for i, j in zip(*self.pairs):
+            yield Agent.view(self.world, int(i)), Agent.view(self.world, int(j))
+
+    def do_steps(self):
+        self.world.step(self.tick)
+
+    def get_distances(self, agent):
+        distances = {}
+        others = [node for node in self.nodes if node != agent]
+        for other in others:
+            distances[other] = self.distance(agent, other)
+        return distances
+
+    def trade(self, agent1, agent2):
+        success = False
+        for r1 in RESOURCE_LIST:
+            for r2 in RESOURCE_LIST:
+                if r1 == r2:
+                    continue
+                if r1 == agent1.want and agent2.resources[r1] > 0:
+                    agent2.resources[r1] -= 1
+                    agent1.resources[r1] += 1
+                    success = True
+                if r1 == agent2.want and agent1.resources[r1] > 0:
+                    agent1.resources[r1] -= 1
+                    agent2.resources[r1] += 1
+                    success = True
+        return success
+
+    def do_trades(self):
+        i, j, dist = self.find_pairs()
+        self.pairs = (i, j)
+        self.trades = self.world.trade(i, j, dist, units=TRADE_UNITS)
+        if self.profiler is not None:
+            self.profiler.count("trades", len(self.trades.amount))
+        if self.network is not None:
+            self.network.record(self.trades, self.world.next_uid, self.world.uid)
+        if self.stats is not None:
+            self.stats.record(self.trades, self.tick)
+        if self.recorder is not None:
+            self.recorder.record(self.tick, self.trades, self.world.resources, self.world.uid)
+        if self.verbose:
+            self.print_trades()
+
+    def print_trades(self):
+        for a, b in zip(self.trades.i, self.trades.j):
+            agent1, agent2 = Agent.view(self.world, int(a)), Agent.view(self.world, int(b))
+            print(
+                agent1.name
+                + " : "
+                + str(agent1.resources.get_tuple())
+                + " <-> "
+                + agent2.name
+                + " : "
+                + str(agent2.resources.get_tuple())
+            )
+
+    def count_all_resources(self):
+        return Resources.from_tuple(self.world.totals)
+
+    def update(self):
+        profiler = self.profiler
+        if profiler is None:
+            self.do_steps()
+            self.do_trades()
+        else:
+            with profiler.phase("do_steps"):
+                self.do_steps()
+            with profiler.phase("do_trades"):
+                self.do_trades()
+        self.tick += 1
+        if self.frame_recorder is not None:
+            self.frame_recorder.capture(self)
+
+    def check_for_winner(self):
+        holder, amount = self.world.max_holding()
+        best = int(np.argmax(amount))
+        if amount[best] >= self.config.win_amount:
+            return Agent.view(self.world, int(holder[best]))
+        return None
+
+
+def random_graph(n_agents=None, seed=None, config=None):
+    """
+    Build a graph of randomly placed agents.
+    :param n_agents: Number of agents (default: config.n_agents)
+    :param seed: Seed (or SeedSequence) for both the population and the per-tick random stream
+    :param config: SimConfig with the run parameters
+    :return: AgentGraph
+    """
+    if config is None:
+        config = SimConfig()
+    if n_agents is None:
+        n_agents = config.n_agents
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    population_seed, tick_seed = seed.spawn(2)
+    rng = np.random.default_rng(population_seed)
+    name_rng = np.random.default_rng(population_seed.spawn(1)[0])
+
+    graph = AgentGraph(seed=tick_seed, config=config)
+    graph.world.reserve(n_agents)
+    names = generate_names(n_agents, sylb=(1, 2, 3), rng=name_rng, unique=True)
+    names, fields = random_cohort(n_agents, rng, config, names=names)
+    graph.add_agents(names, **fields)
+    return graph
+
+
+def random_cohort(n, rng, config=None, names=None, exclude=()):
+    """
+    Draw the state of `n` new agents in bulk: the batch version of make_name, a random color
+    and Resources.randomize.
+    :param rng: np.random.Generator
+    :param names: Names to use instead of generated ones
+    :param exclude: Names the generated ones must differ from, e.g. those already in the world
+    :return: (names, fields) for World.extend or World.spawn
+    """
+    if config is None:
+        config = SimConfig()
+    if names is None:
+        names = generate_names(n, sylb=3, rng=rng, unique=True, exclude=exclude)
+    fields = dict(
+        loc=rng.integers(0, min(config.width, config.height), (n, 2)),
+        bearing=rng.random(n) * 2 * np.pi,
+        color=np.array(COLORS, dtype=np.uint8)[rng.integers(len(COLORS), size=n)],
+        want=rng.integers(len(RESOURCE_LIST), size=n),
+        resources=rng.integers(0, 10, (n, len(RESOURCE_LIST))),
+        steprate=config.steprate,
+        stepsize=config.stepsize,
+        turn_variance=config.turn_variance,
+    )
+    return names, fields
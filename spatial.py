@@ -0,0 +1,134 @@
+import numpy as np
+
+
+class SpatialGrid:
+    """
+    Uniform cell list for fixed-radius neighbor search.
+
+    Cells are at least `cell_size` wide, so every pair closer than `cell_size` sits in the
+    same or an adjacent cell and only those nine cells have to be checked per agent. On a
+    torus the neighbor cells and the distances wrap around the world edges.
+    """
+
+    def __init__(self, width, height, cell_size, torus=True):
+        """
+        :param width: World width
+        :param height: World height
+        :param cell_size: Minimum cell edge, normally the trade distance
+        :param torus: Wrap neighbor cells and distances around the edges
+        """
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.nx = max(1, int(width // cell_size))
+        self.ny = max(1, int(height // cell_size))
+        self.cell_w = width / self.nx
+        self.cell_h = height / self.ny
+        self.loc = np.empty((0, 2))
+        self.order = np.empty(0, dtype=np.int64)
+        self.cell = np.empty(0, dtype=np.int64)
+        self.starts = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        self.checked = 0  # candidate pairs examined by the last pairs() call
+
+    @property
+    def bounds(self):
+        return np.array([self.width, self.height], dtype=np.float64)
+
+    def cell_coords(self, loc):
+        cx = np.clip((loc[:, 0] // self.cell_w).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip((loc[:, 1] // self.cell_h).astype(np.int64), 0, self.ny - 1)
+        return cx, cy
+
+    def build(self, loc):
+        """Bin positions into cells. Returns self so calls can be chained."""
+        self.loc = np.asarray(loc, dtype=np.float64)
+        cx, cy = self.cell_coords(self.loc)
+        self.cell = cy * self.nx + cx
+        self.order = np.argsort(self.cell, kind="stable")
+        counts = np.bincount(self.cell, minlength=self.nx * self.ny)
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+        return self
+
+    def displacement(self, src, dst):
+        """Shortest vector from `src` to `dst`, taking the wraparound into account."""
+        delta = dst - src
+        if self.torus:
+            delta -= self.bounds * np.round(delta / self.bounds)
+        return delta
+
+    def _shifts(self, n):
+        if self.torus:
+            # with fewer than three cells along an axis, -1 and +1 land on the same cell
+            return np.unique(np.array([-1, 0, 1]) % n)
+        return np.array([-1, 0, 1])
+
+    def _cell_members(self, agents, cells):
+        """Pair every agent with every member of the matching cell."""
+        counts = self.starts[cells + 1] - self.starts[cells]
+        total = counts.sum()
+        first = np.repeat(self.starts[cells] - np.cumsum(counts) + counts, counts)
+        members = self.order[first + np.arange(total)]
+        return np.repeat(agents, counts), members
+
+    def _cell_range(self, lo, hi, size, n):
+        first, last = int(np.floor(lo / size)), int(np.floor(hi / size))
+        if self.torus:
+            if last - first + 1 >= n:
+                return np.arange(n)
+            return np.arange(first, last + 1) % n
+        return np.arange(max(first, 0), min(last, n - 1) + 1)
+
+    def in_rect(self, lo, hi):
+        """
+        Find the agents inside an axis-aligned rectangle, looking only at the cells it overlaps.
+        :param lo: (x, y) of the lower corner
+        :param hi: (x, y) of the upper corner; on a torus the rectangle may extend past the edges
+        :return: Sorted agent indices
+        """
+        lo, hi = np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+        cols = self._cell_range(lo[0], hi[0], self.cell_w, self.nx)
+        rows = self._cell_range(lo[1], hi[1], self.cell_h, self.ny)
+        cells = (rows[:, None] * self.nx + cols[None, :]).ravel()
+        _, members = self._cell_members(cells, cells)
+        loc = self.loc[members]
+        if self.torus:
+            # measured from the middle, so the rectangle wraps like the world does
+            half = (hi - lo) / 2
+            offset = np.abs(self.displacement(lo + half, loc))
+            inside = np.all((offset <= half) | (half >= self.bounds / 2), axis=1)
+        else:
+            inside = np.all((loc >= lo) & (loc <= hi), axis=1)
+        return np.sort(members[inside])
+
+    def candidates(self):
+        """Index pairs (i, j), i < j, of agents in the same or adjacent cells."""
+        agents = np.arange(len(self.loc))
+        cx, cy = self.cell_coords(self.loc)
+        found_i, found_j = [], []
+        for dx in self._shifts(self.nx):
+            for dy in self._shifts(self.ny):
+                ncx, ncy = cx + dx, cy + dy
+                if self.torus:
+                    ncx, ncy = ncx % self.nx, ncy % self.ny
+                    valid = agents
+                else:
+                    valid = np.flatnonzero((ncx >= 0) & (ncx < self.nx) & (ncy >= 0) & (ncy < self.ny))
+                i, j = self._cell_members(valid, ncy[valid] * self.nx + ncx[valid])
+                keep = i < j
+                found_i.append(i[keep])
+                found_j.append(j[keep])
+        return np.concatenate(found_i), np.concatenate(found_j)
+
+    def pairs(self, radius):
+        """
+        Find all pairs of agents closer than `radius`.
+        :param radius: Search radius, at most the cell size
+        :return: Index arrays (i, j) with i < j sorted by (i, j), and their distances
+        """
+        i, j = self.candidates()
+        self.checked = len(i)
+        dist = np.linalg.norm(self.displacement(self.loc[i], self.loc[j]), axis=1)
+        keep = dist < radius
+        i, j, dist = i[keep], j[keep], dist[keep]
+        order = np.lexsort((j, i))
+        return i[order], j[order], dist[order]
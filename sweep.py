@@ -0,0 +1,146 @@
+"""Monte-Carlo parameter sweeps of the trading game across a process pool."""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, fields, replace
+
+import numpy as np
+
+from headless import run_headless
+from simulation import RESOURCE_LIST, SimConfig, random_graph
+
+CONFIG_FIELDS = [f.name for f in fields(SimConfig)]
+RESULT_FIELDS = ["winner", "ticks", "elapsed", "ticks_per_second", "gini", "top_share"]
+COLUMNS = ["run_id", "replicate"] + CONFIG_FIELDS + RESULT_FIELDS + ["total_" + r for r in RESOURCE_LIST]
+
+
+def expand_grid(grid):
+    """
+    Expand a parameter grid into a list of SimConfigs.
+    :param grid: Dict mapping SimConfig field names to lists of values
+    :return: One SimConfig per point of the cartesian product
+    """
+    unknown = set(grid) - set(CONFIG_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown sweep parameters: {sorted(unknown)}")
+    keys = sorted(grid)
+    return [replace(SimConfig(), **dict(zip(keys, values))) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def gini(values):
+    """Gini coefficient of a non-negative array (0 = equal, 1 = one agent holds everything)."""
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(values)
+    total = values.sum()
+    if n == 0 or total == 0:
+        return 0.0
+    return float((2 * np.arange(1, n + 1) - n - 1) @ values / (n * total))
+
+
+def run_one(run_id, replicate, config, seed, max_ticks):
+    """Run a single simulation and return its result row."""
+    graph = random_graph(seed=seed, config=config)
+    result = run_headless(graph, max_ticks=max_ticks)
+    wealth = graph.world.resources.sum(axis=1)
+    row = {"run_id": run_id, "replicate": replicate, **asdict(config)}
+    row.update(
+        winner=result.winner or "",
+        ticks=result.ticks,
+        elapsed=result.elapsed,
+        ticks_per_second=result.ticks_per_second,
+        gini=gini(wealth),
+        top_share=wealth.max() / wealth.sum() if wealth.sum() > 0 else 0.0,
+    )
+    for r in RESOURCE_LIST:
+        row["total_" + r] = result.totals[r]
+    return row
+
+
+def completed_runs(path):
+    """Return the run ids already present in a results file."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as f:
+        return {int(row["run_id"]) for row in csv.DictReader(f)}
+
+
+def run_sweep(grid, path, replicates=1, base_seed=0, max_ticks=10_000, workers=None):
+    """
+    Run every grid point `replicates` times and append one CSV row per run to `path`.
+
+    Run i is seeded with SeedSequence(base_seed, spawn_key=(i,)), so every run has its own
+    independent random stream no matter which worker executes it. Rows are written as runs
+    finish; calling this again with the same arguments skips the runs already on disk.
+    :param grid: Dict mapping SimConfig field names to lists of values
+    :param path: CSV file to append results to
+    :param replicates: Number of seeds per grid point
+    :param base_seed: Root entropy for all run seeds
+    :param max_ticks: Tick limit per run
+    :param workers: Number of worker processes (default: os.cpu_count())
+    :return: Number of runs executed by this call
+    """
+    configs = expand_grid(grid)
+    meta = {"grid": grid, "replicates": replicates, "base_seed": base_seed, "max_ticks": max_ticks}
+    meta_path = path + ".json"
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) != json.loads(json.dumps(meta)):
+                raise ValueError(f"{path} belongs to a different sweep, see {meta_path}")
+    else:
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+
+    done = completed_runs(path)
+    runs = [
+        (run_id, replicate, config)
+        for run_id, (config, replicate) in enumerate(itertools.product(configs, range(replicates)))
+        if run_id not in done
+    ]
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="") as f, ProcessPoolExecutor(workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+        futures = [
+            pool.submit(run_one, run_id, replicate, config, np.random.SeedSequence(base_seed, spawn_key=(run_id,)), max_ticks)
+            for run_id, replicate, config in runs
+        ]
+        for future in as_completed(futures):
+            writer.writerow(future.result())
+            f.flush()
+    return len(runs)
+
+
+def parse_grid(items):
+    """Parse command-line items like trade_distance=50,100 into a grid dict."""
+    types = {f.name: f.type for f in fields(SimConfig)}
+    grid = {}
+    for item in items:
+        key, _, values = item.partition("=")
+        if key not in types:
+            raise ValueError(f"unknown sweep parameter {key!r}")
+        cast = types[key] if types[key] is not bool else lambda v: v.lower() in ("1", "true", "yes")
+        grid[key] = [cast(v) for v in values.split(",")]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="CSV file for the results (appended to when resuming)")
+    parser.add_argument("grid", nargs="*", help="parameter values, e.g. trade_distance=50,100 n_agents=20,200")
+    parser.add_argument("--replicates", type=int, default=1, help="seeds per grid point")
+    parser.add_argument("--seed", type=int, default=0, help="root seed of the sweep")
+    parser.add_argument("--ticks", type=int, default=10_000, help="maximum ticks per run")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    args = parser.parse_args()
+
+    n = run_sweep(parse_grid(args.grid), args.path, args.replicates, args.seed, args.ticks, args.workers)
+    print(f"ran {n} simulations, results in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
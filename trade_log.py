@@ -0,0 +1,110 @@
+"""Binary trade-event log: a preallocated record buffer flushed to disk in bulk."""
+
+import os
+
+import numpy as np
+
+# one record per transfer; giver and receiver are agent uids (slots in logs written without them),
+# the *_after fields hold the stock at the end of the tick
+TRADE_DTYPE = np.dtype(
+    [
+        ("tick", "<u4"),
+        ("giver", "<i4"),
+        ("receiver", "<i4"),
+        ("resource", "u1"),
+        ("amount", "u1"),
+        ("giver_after", "<i4"),
+        ("receiver_after", "<i4"),
+    ]
+)
+
+
+class TradeRecorder:
+    """
+    Append trade events to a raw TRADE_DTYPE file.
+
+    Events are collected in a preallocated record array and written with a single
+    `write` whenever it fills up, so recording costs a few array copies per tick.
+    """
+
+    def __init__(self, path, capacity=1 << 16, append=False):
+        """
+        :param path: Output file
+        :param capacity: Number of records buffered before a flush
+        :param append: Add to an existing log instead of truncating it
+        """
+        self.path = path
+        self.buffer = np.zeros(capacity, dtype=TRADE_DTYPE)
+        self.fill = 0
+        self.total = 0
+        self.file = open(path, "ab" if append else "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, tick, trades, resources, uid=None):
+        """
+        Append the transfers of one tick.
+        :param tick: Tick number
+        :param trades: world.Trades returned by World.trade
+        :param resources: Resource matrix after the trades were applied
+        :param uid: uid of every slot (world.uid), so an agent in a reused slot is told apart from
+            the one that died there (default: log the slots)
+        """
+        n = len(trades.amount)
+        if n == 0:
+            return
+        if self.fill + n > len(self.buffer):
+            self.flush()
+        out = self.buffer[self.fill : self.fill + n] if n <= len(self.buffer) else np.empty(n, dtype=TRADE_DTYPE)
+        out["tick"] = tick
+        out["giver"] = trades.giver if uid is None else uid[trades.giver]
+        out["receiver"] = trades.receiver if uid is None else uid[trades.receiver]
+        out["resource"] = trades.resource
+        out["amount"] = trades.amount
+        out["giver_after"] = resources[trades.giver, trades.resource]
+        out["receiver_after"] = resources[trades.receiver, trades.resource]
+        if n > len(self.buffer):
+            self.file.write(out.tobytes())
+        else:
+            self.fill += n
+        self.total += n
+
+    def flush(self):
+        if self.fill:
+            self.file.write(self.buffer[: self.fill].tobytes())
+            self.fill = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def read_trades(path):
+    """Memory-map a trade log as a TRADE_DTYPE record array."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=TRADE_DTYPE)
+    return np.memmap(path, dtype=TRADE_DTYPE, mode="r")
+
+
+def tick_slice(records, start, stop=None):
+    """Return the records with start <= tick < stop (records are stored in tick order)."""
+    if stop is None:
+        stop = start + 1
+    lo, hi = np.searchsorted(records["tick"], [start, stop])
+    return records[lo:hi]
+
+
+def agent_trades(records, agent):
+    """Return the records in which `agent` (a uid, or a slot in logs written without uids) gave or received something."""
+    return records[(records["giver"] == agent) | (records["receiver"] == agent)]
+
+
+def trades_per_tick(records):
+    """Number of transfers per tick, indexed by tick."""
+    return np.bincount(records["tick"])
@@ -0,0 +1,247 @@
+"""Cumulative trade network: who traded with whom, stored as sparse arrays, with bulk graph analytics."""
+
+import numpy as np
+
+_SHIFT = np.int64(32)  # an undirected edge (a, b), a < b, is stored as the key a << 32 | b
+_LOW = np.int64((1 << 32) - 1)
+
+
+def _edge_keys(a, b):
+    a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+    return (np.minimum(a, b) << _SHIFT) | np.maximum(a, b)
+
+
+class TradeNetwork:
+    """
+    Every pair of agents that ever traded, with how often and how much.
+
+    Agents are the nodes 0 .. n_agents-1, normally their uids, so a despawned agent keeps its
+    edges and totals and an agent spawned into its slot starts without any.
+
+    Edges are kept as a sorted array of 64-bit keys with parallel count and volume arrays.
+    Each tick's trades are appended as a COO chunk and merged into the sorted arrays in bulk
+    once enough have piled up, so recording costs a few array operations per tick. Connected
+    components are maintained incrementally with an array-based union-find, since edges are
+    never removed; PageRank runs on demand as power iteration over the edge arrays.
+    """
+
+    def __init__(self, n_agents=0, compact_every=1 << 20):
+        """
+        :param n_agents: Initial population size (grows with record)
+        :param compact_every: Merge pending edges once this many have been recorded
+        """
+        self.n_agents = 0
+        self.compact_every = compact_every
+        self.ticks = 0
+        self._keys = np.empty(0, dtype=np.int64)
+        self._count = np.empty(0, dtype=np.int64)  # ticks on which the pair traded
+        self._volume = np.empty(0, dtype=np.int64)  # units moved between the pair, both directions
+        self._pending = []
+        self._pending_size = 0
+        self.parent = np.empty(0, dtype=np.int64)  # union-find forest, parent[x] <= x
+        self.given = np.empty(0, dtype=np.int64)
+        self.received = np.empty(0, dtype=np.int64)
+        self.rank = None  # last PageRank, reused as the starting point of the next one
+        self._grow(n_agents)
+
+    def _grow(self, n_agents):
+        if n_agents <= self.n_agents:
+            return
+        extra = n_agents - self.n_agents
+        self.parent = np.concatenate((self.parent, np.arange(self.n_agents, n_agents)))
+        self.given = np.concatenate((self.given, np.zeros(extra, dtype=np.int64)))
+        self.received = np.concatenate((self.received, np.zeros(extra, dtype=np.int64)))
+        self.n_agents = n_agents
+
+    def record(self, trades, n_agents=None, uid=None):
+        """
+        Add one tick of trades.
+        :param trades: world.Trades returned by World.trade
+        :param n_agents: Number of nodes, i.e. world.next_uid (default: large enough for the agents seen)
+        :param uid: uid of every slot (world.uid) to record the trades under (default: the slots)
+        """
+        i, j, giver, receiver = trades.i, trades.j, trades.giver, trades.receiver
+        if uid is not None:
+            i, j, giver, receiver = uid[i], uid[j], uid[giver], uid[receiver]
+        if n_agents is None:
+            n_agents = int(max(i.max(initial=-1), j.max(initial=-1))) + 1
+        self._grow(n_agents)
+        self.ticks += 1
+        if len(i) == 0:
+            return
+        pairs = _edge_keys(i, j)
+        transfers = _edge_keys(giver, receiver)
+        amount = trades.amount.astype(np.int64)
+        self._pending.append(
+            (
+                np.concatenate((pairs, transfers)),
+                np.concatenate((np.ones(len(pairs), dtype=np.int64), np.zeros(len(transfers), dtype=np.int64))),
+                np.concatenate((np.zeros(len(pairs), dtype=np.int64), amount)),
+            )
+        )
+        self._pending_size += len(pairs) + len(transfers)
+        self.given += np.bincount(giver, amount, minlength=self.n_agents).astype(np.int64)
+        self.received += np.bincount(receiver, amount, minlength=self.n_agents).astype(np.int64)
+        self._union(i.astype(np.int64), j.astype(np.int64))
+        if self._pending_size >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Merge the pending edge chunks into the sorted edge arrays."""
+        if not self._pending:
+            return
+        keys, count, volume = (np.concatenate(parts) for parts in zip((self._keys, self._count, self._volume), *self._pending))
+        self._keys, inverse = np.unique(keys, return_inverse=True)
+        self._count = np.bincount(inverse, count, minlength=len(self._keys)).astype(np.int64)
+        self._volume = np.bincount(inverse, volume, minlength=len(self._keys)).astype(np.int64)
+        self._pending = []
+        self._pending_size = 0
+
+    # union-find
+
+    def _find(self, x):
+        parent = self.parent
+        root = parent[x]
+        while True:
+            up = parent[root]
+            if np.array_equal(up, root):
+                return root
+            root = up
+
+    def _union(self, a, b):
+        merged = False
+        while len(a):
+            ra, rb = self._find(a), self._find(b)
+            apart = ra != rb
+            if not apart.any():
+                break
+            a, b, ra, rb = a[apart], b[apart], ra[apart], rb[apart]
+            # hang the larger root under the smaller one; conflicts are resolved on the next pass
+            np.minimum.at(self.parent, np.maximum(ra, rb), np.minimum(ra, rb))
+            merged = True
+        if merged:
+            self._compress()
+
+    def _compress(self):
+        parent = self.parent
+        while True:
+            up = parent[parent]
+            if np.array_equal(up, parent):
+                break
+            parent = up
+        self.parent = parent
+
+    # analytics
+
+    def edges(self):
+        """
+        All edges merged so far.
+        :return: (a, b, count, volume) arrays with a < b, sorted by (a, b)
+        """
+        self.compact()
+        return self._keys >> _SHIFT, self._keys & _LOW, self._count, self._volume
+
+    def __len__(self):
+        self.compact()
+        return len(self._keys)
+
+    def coo(self, weight="volume"):
+        """Symmetric adjacency as (rows, cols, data); weight is "volume", "count" or None for ones."""
+        a, b, count, volume = self.edges()
+        data = {"volume": volume, "count": count, None: np.ones(len(a), dtype=np.int64)}[weight]
+        return np.concatenate((a, b)), np.concatenate((b, a)), np.concatenate((data, data))
+
+    def csr(self, weight="volume"):
+        """Symmetric adjacency in CSR form: (indptr, indices, data) with n_agents rows."""
+        rows, cols, data = self.coo(weight)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(self.n_agents + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.n_agents), out=indptr[1:])
+        return indptr, cols[order], data[order]
+
+    def degree(self):
+        """Number of distinct trading partners of every agent."""
+        a, b, _, _ = self.edges()
+        return np.bincount(a, minlength=self.n_agents) + np.bincount(b, minlength=self.n_agents)
+
+    def degree_distribution(self):
+        """Number of agents with 0, 1, 2, ... distinct partners."""
+        return np.bincount(self.degree())
+
+    def strength(self):
+        """Units each agent gave plus units it received."""
+        return self.given + self.received
+
+    def components(self):
+        """
+        Connected components of the trade network.
+        :return: (labels, sizes): the component of every agent, numbered from 0, and the size of each
+        """
+        _, labels, sizes = np.unique(self.parent, return_inverse=True, return_counts=True)
+        return labels, sizes
+
+    def pagerank(self, weight="volume", damping=0.85, tol=1e-10, max_iter=100):
+        """
+        Weighted PageRank by power iteration, started from the previous result.
+        Agents without trades spread their rank uniformly.
+        :return: Array of scores summing to 1
+        """
+        n = self.n_agents
+        if n == 0:
+            return np.empty(0)
+        rows, cols, data = self.coo(weight)
+        data = data.astype(np.float64)
+        out_weight = np.bincount(rows, data, minlength=n)
+        dangling = out_weight == 0
+        share = data / out_weight[rows] if len(rows) else data
+        rank = np.full(n, 1 / n)
+        if self.rank is not None:
+            rank[: len(self.rank)] = self.rank[:n]
+            rank /= rank.sum()
+        for _ in range(max_iter):
+            spread = np.bincount(cols, share * rank[rows], minlength=n)
+            new = (1 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+            done = np.abs(new - rank).sum() < tol
+            rank = new
+            if done:
+                break
+        self.rank = rank
+        return rank
+
+    def summary(self, top=5):
+        """Headline numbers of the network as a dict."""
+        labels, sizes = self.components()
+        degree = self.degree()
+        rank = self.pagerank()
+        leaders = np.argsort(rank)[::-1][:top]
+        return {
+            "ticks": self.ticks,
+            "agents": self.n_agents,
+            "edges": len(self),
+            "mean_degree": float(degree.mean()) if self.n_agents else 0.0,
+            "max_degree": int(degree.max()) if self.n_agents else 0,
+            "components": len(sizes),
+            "largest_component": int(sizes.max()) if len(sizes) else 0,
+            "isolated": int(np.count_nonzero(degree == 0)),
+            "top_pagerank": [(int(agent), float(rank[agent])) for agent in leaders],
+        }
+
+    def save(self, path):
+        """Write the network to an .npz file."""
+        a, b, count, volume = self.edges()
+        np.savez(
+            path, a=a, b=b, count=count, volume=volume, parent=self.parent, given=self.given, received=self.received, ticks=self.ticks
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            network = cls(len(data["parent"]))
+            network._keys = _edge_keys(data["a"], data["b"])
+            network._count = data["count"]
+            network._volume = data["volume"]
+            network.parent = data["parent"]
+            network.given = data["given"]
+            network.received = data["received"]
+            network.ticks = int(data["ticks"])
+        return network
@@ -1,233 +1,39 @@
 import pygame
 import sys
-import numpy as np
-import networkx as nx
 
-from names import generate_random_name
-import random
-import time
+from profiling import Profiler
+from render import Camera, Renderer
+from sim_thread import InterpolatedView, SimulationThread
+from simulation import (
+    BLACK,
+    HEIGHT,
+    N_AGENTS,
+    RED,
+    RESOURCE_LIST,
+    WHITE,
+    WIDTH,
+    AgentGraph,
+    SimConfig,
+    random_graph,
+)
+from wealth_stats import WealthStats
 
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-BLUE = (0, 0, 255)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-ORANGE = (255, 165, 0)
-YELLOW = (255, 255, 0)
-PURPLE = (128, 0, 128)
-CYAN = (0, 255, 255)
-MAGENTA = (255, 0, 255)
-COLORS = [WHITE, BLACK, BLUE, RED, GREEN, ORANGE, YELLOW, PURPLE, CYAN, MAGENTA]
-
-
-def opposite_color(rbg):
-    return tuple(255 - x for x in rbg)
-
-
-BACKGROUND_COLOR = np.ones(3) * 50
 FRAMERATE_DEFAULT = 30
-WIDTH = 720
-HEIGHT = 1280
-TORUS = True
-
-RESOURCE_LIST = ["dew", "bast", "sap"]
-
-N_AGENTS = 20
-
-STEPRATE_DEFAULT = 0.5
-STEPSIZE_DEFAULT = 5
-TURN_VARIANCE_DEFAULT = 0.4
-TRADE_DISTANCE_DEFAULT = 100
-
-
-def make_name(sylb=3):
-    return generate_random_name(sylb)
-
-
-def choose_random_other(lst, item):
-    return random.choice([x for x in lst if x != item])
-
-
-class Resources(dict):
-    def __init__(self):
-        super().__init__()
-        for resource in RESOURCE_LIST:
-            self[resource] = 0
-
-    def __str__(self):
-        return ", ".join([str(v) + " " + k for k, v in self.items()])
-
-    def __repr__(self):
-        return self.__str__()
-
-    def __add__(self, other):
-        result = Resources()
-        for k in self.keys():
-            result[k] = self[k] + other[k]
-        return result
-
-    def __sub__(self, other):
-        result = Resources()
-        for k in self.keys():
-            result[k] = self[k] - other[k]
-        return result
-
-    def randomize(self):
-        for k in self.keys():
-            self[k] = np.random.randint(0, 10)
-
-    def get_tuple(self):
-        return (self["dew"], self["bast"], self["sap"])
-
-
-class Agent:
-    def __init__(self, name, loc=np.array([0, 0]), bearing=0.0, color=None):
-        self.name = name
-        self.loc = loc
-        self.bearing = bearing
-        if color is None:
-            self.color = random.choice(COLORS)
-        else:
-            self.color = color
-
-        self.resources = Resources()
-        self.resources.randomize()
-        self.trading_with = None
-        self.want = random.choice(RESOURCE_LIST)
-
-        self.steprate = STEPRATE_DEFAULT  # ratio
-        self.stepsize = STEPSIZE_DEFAULT  # int
-        self.turn_variance = TURN_VARIANCE_DEFAULT
-
-    def step(self, step=np.array([0, 0])):
-        if TORUS:
-            self.loc = np.mod(self.loc + step, np.array([WIDTH, HEIGHT]))
-        else:
-            self.loc = np.clip(self.loc + step, np.array([0, 0]), np.array([WIDTH, HEIGHT]))
-
-    def __str__(self):
-        """print all properties"""
-        out = []
-        out.append(f"name\t{self.name}")
-        out.append(f"loc\t{self.loc}")
-        out.append(f"color\t{self.color}")
-        out.append(f"resources\t{self.resources}")
-        out.append(f"trading_with\t{self.trading_with}")
-        out.append(f"want\t{self.want}")
-        return "\n".join(out)
-
-    def __repr__(self):
-        return self.__str__()
-
-
-class AgentGraph(nx.Graph):
-    def __init__(self, agents=None):
-        super().__init__()
-        if agents is not None:
-            for agent in agents:
-                self.add_agent(agent)
-        self.trade_distance = TRADE_DISTANCE_DEFAULT
-        self.traded_edges = set()  # Track edges where trades occur
-
-    def add_agent(self, agent):
-        self.add_node(agent)
-        others = [node for node in self.nodes if node != agent]
-        for other in others:
-            self.add_edge(agent, other)
-
-    def __str__(self):
-        out = "Agents:\n"
-        if len(self.nodes) == 0:
-            out += "None"
-        else:
-            out += "\n".join([str(agent) for agent in self.nodes])
-        return out
-
-    def __repr__(self):
-        return self.__str__()
-
-    def distance(self, agent1, agent2):
-        return np.linalg.norm(agent1.loc - agent2.loc)
-
-    def do_steps(self):
-        for agent in self.nodes:
-            if np.random.rand() < agent.steprate:
-                agent.bearing += np.random.randn() * agent.turn_variance
-                step = np.array([np.cos(agent.bearing), np.sin(agent.bearing)]) * agent.stepsize
-                agent.step(step)
-
-    def get_distances(self, agent):
-        distances = {}
-        others = [node for node in self.nodes if node != agent]
-        for other in others:
-            distances[other] = self.distance(agent, other)
-        return distances
-
-    def trade(self, agent1, agent2):
-        success = False
-        for r1 in RESOURCE_LIST:
-            for r2 in RESOURCE_LIST:
-                if r1 == r2:
-                    continue
-                if r1 == agent1.want and agent2.resources[r1] > 0:
-                    agent2.resources[r1] -= 1
-                    agent1.resources[r1] += 1
-                    success = True
-                if r1 == agent2.want and agent1.resources[r1] > 0:
-                    agent1.resources[r1] -= 1
-                    agent2.resources[r1] += 1
-                    success = True
-        return success
-
-    def do_trades(self):
-        self.traded_edges.clear()  # Clear previous trades
-        for pair in self.edges:
-            agent1, agent2 = pair
-            if self.distance(agent1, agent2) < self.trade_distance:
-                if agent1.want != agent2.want:
-                    success = self.trade(agent1, agent2)
-                    if success:
-                        agent1.trading_with = agent2
-                        agent2.trading_with = agent1
-                        self.traded_edges.add(pair)  # Mark this edge as traded
-                        agent1.step((agent2.loc - agent1.loc) / 2)
-                        agent2.step((agent1.loc - agent2.loc) / 2)
-                        print(
-                            agent1.name
-                            + " : "
-                            + str(agent1.resources.get_tuple())
-                            + " <-> "
-                            + agent2.name
-                            + " : "
-                            + str(agent2.resources.get_tuple())
-                        )
-                else:
-                    agent1.trading_with = None
-                    agent2.trading_with = None
-            else:
-                agent1.trading_with = None
-                agent2.trading_with = None
-
-    def count_all_resources(self):
-        resources = Resources()
-        for agent in self.nodes:
-            resources += agent.resources
-        return resources
-
-    def update(self):
-        self.do_steps()
-        self.do_trades()
-
-    def check_for_winner(self):
-        win_amount = 50
-        for agent in self.nodes:
-            if max(agent.resources.get_tuple()) >= win_amount:
-                return agent
-        return None
+PAN_STEP = 0.1  # share of the window panned per key press
+ZOOM_STEP = 1.25
+PAN_KEYS = {pygame.K_a: (1, 0), pygame.K_d: (-1, 0), pygame.K_w: (0, 1), pygame.K_s: (0, -1)}
 
 
 class App:
-    def __init__(self, width=WIDTH, height=HEIGHT):
+    def __init__(self, width=WIDTH, height=HEIGHT, profile=False):
+        """
+        :param width: Window width
+        :param height: Window height
+        :param profile: Start with the profiling overlay shown (toggle with F3)
+
+        The camera follows the mouse wheel (zoom), dragging (pan), WASD (pan), +/- (zoom)
+        and F (show the whole world).
+        """
         pygame.init()
         self.screen = pygame.display.set_mode((width, height))
         pygame.display.set_caption("syzm")
@@ -235,7 +41,15 @@ class App:
         pygame.display.set_icon(pygame_icon)
         self.clock = pygame.time.Clock()
         self.agents = []
-        self.font = pygame.font.SysFont(pygame.font.get_fonts()[0], 16, bold=True)
+        fonts = pygame.font.get_fonts()
+        # fall back to pygame's bundled font on machines without system fonts (e.g. headless benchmarks)
+        self.font = pygame.font.SysFont(fonts[0], 16, bold=True) if fonts else pygame.font.Font(None, 16)
+        self.camera = Camera((width, height))
+        self.renderer = Renderer(self.screen, self.font, camera=self.camera)
+        self._fitted = None  # size of the world the camera was last fitted to
+        self.profiler = Profiler()
+        self.profiling = profile
+        self.overlay_font = pygame.font.SysFont("monospace", 14) if fonts else pygame.font.Font(None, 18)
 
     def draw_button(self, text, rect, color, text_color):
         """Draw a button with text."""
@@ -247,7 +61,8 @@ class App:
     def start_screen(self):
         """Display the start screen with a Start button."""
         running = True
-        button_rect = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2 - 30, 200, 60)  # Button dimensions
+        width, height = self.screen.get_size()
+        button_rect = pygame.Rect(width // 2 - 100, height // 2 - 30, 200, 60)  # Button dimensions
         while running:
             self.screen.fill(BLACK)
             self.draw_button("START", button_rect, RED, WHITE)
@@ -264,37 +79,70 @@ class App:
             self.clock.tick(FRAMERATE_DEFAULT)
 
     def draw_graph(self, graph: "AgentGraph"):
-        # Draw edges
-        for edge in graph.edges:
-            agent1, agent2 = edge
-            if edge in graph.traded_edges:
-                pygame.draw.line(self.screen, MAGENTA, agent1.loc, agent2.loc, 3)  # Light color
-            else:
-                if self.clock.get_time() % 2 == 0:
-                    pygame.draw.line(self.screen, random.choice(COLORS), agent1.loc, agent2.loc, 1)
-                else:
-                    pygame.draw.line(self.screen, BACKGROUND_COLOR + (10, 10, 10), agent1.loc, agent2.loc, 1)
-
-        # Draw agents
-        for agent in graph.nodes:
-            pygame.draw.circle(self.screen, agent.color, agent.loc, 10)
-
-            text = self.font.render(
-                agent.name + " " + str(agent.resources.get_tuple()),
-                True,
-                opposite_color(agent.color),
-            )
-            text_rect = text.get_rect(center=(agent.loc[0], agent.loc[1]))
-            self.screen.blit(text, text_rect)
-
-            if agent.trading_with is not None:
-                pygame.draw.line(self.screen, RED, agent.loc, agent.trading_with.loc, 5)
+        world = graph.world
+        if self._fitted != (world.width, world.height):
+            self.camera.fit(world.width, world.height)
+            self._fitted = (world.width, world.height)
+        self.renderer.draw(graph, flicker=self.clock.get_time() % 2 == 0)
+
+    def handle_event(self, event):
+        """React to the overlay and camera controls."""
+        camera = self.camera
+        if event.type == pygame.MOUSEWHEEL:
+            camera.zoom_at(ZOOM_STEP**event.y, pygame.mouse.get_pos())
+        elif event.type == pygame.MOUSEMOTION and any(event.buttons):
+            camera.pan(*event.rel)
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_F3:
+                self.profiling = not self.profiling
+            elif event.key in PAN_KEYS:
+                dx, dy = PAN_KEYS[event.key]
+                width, height = self.screen.get_size()
+                camera.pan(dx * PAN_STEP * width, dy * PAN_STEP * height)
+            elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                camera.zoom_at(ZOOM_STEP)
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                camera.zoom_at(1 / ZOOM_STEP)
+            elif event.key == pygame.K_f:
+                self._fitted = None
+
+    def attach_profiler(self, graph: "AgentGraph"):
+        """Hook the profiler into graph and renderer while the overlay is shown, detach it otherwise."""
+        # detached hooks cost nothing
+        profiler = self.profiler if self.profiling else None
+        graph.profiler = self.renderer.profiler = profiler
+        return profiler
+
+    def show(self, graph: "AgentGraph", profiler=None, status=(), stats=None):
+        """
+        Draw graph, the overlay if enabled, and push the frame to the display.
+        :param status: Extra lines shown at the top of the overlay
+        :param stats: WealthStats reported in the overlay (default: graph.stats)
+        """
+        if profiler is None:
+            self.draw_graph(graph)
+            self.renderer.present()
+            return
+        with profiler.phase("draw_graph"):
+            self.draw_graph(graph)
+        if stats is None:
+            stats = graph.stats
+        lines = list(status)
+        if stats is not None:
+            lines += stats.report_lines(RESOURCE_LIST)
+        lines += profiler.report_lines()
+        self.renderer.draw_text(lines, self.overlay_font)
+        with profiler.phase("display.flip"):
+            self.renderer.present()
 
     def update(self, graph: "AgentGraph"):
-        self.screen.fill(BACKGROUND_COLOR)
-        graph.update()
-        self.draw_graph(graph)
-        pygame.display.flip()
+        profiler = self.attach_profiler(graph)
+        if profiler is None:
+            graph.update()
+        else:
+            with profiler.phase("update"):
+                graph.update()
+        self.show(graph, profiler)
         winner = graph.check_for_winner()
         if winner is not None:
             print(winner.name + " wins!")
@@ -308,20 +156,94 @@ class App:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                else:
+                    self.handle_event(event)
             self.update(graph)
             self.clock.tick(FRAMERATE_DEFAULT)
         pygame.quit()
         sys.exit()
 
+    def run_decoupled(self, graph: "AgentGraph", tick_rate=None):
+        """
+        Simulate in a background thread and render the latest state at the display frame rate.
+        Positions are interpolated between ticks, and a slow tick never blocks event handling.
+        :param tick_rate: Maximum simulation ticks per second (None: as fast as possible)
+        """
+        self.start_screen()
+        worker = SimulationThread(graph, tick_rate)
+        view = InterpolatedView(graph.config)
+        worker.start()
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                else:
+                    self.handle_event(event)
+            # the graph hooks fire on the worker thread, the renderer hooks on this one
+            profiler = self.attach_profiler(graph)
+            previous, current = worker.snapshots()
+            # stats are read while the worker updates them; a frame may mix two ticks
+            self.show(view.update(previous, current), profiler, [f"tick {current.tick}"], graph.stats)
+            if current.winner is not None:
+                print(current.winner + " wins!")
+                running = False
+            self.clock.tick(FRAMERATE_DEFAULT)
+        worker.stop()
+        pygame.quit()
+        sys.exit()
+
+    def replay(self, replay, speed=1.0):
+        """
+        Redraw a recorded run without simulating it.
+        :param replay: checkpoint.Replay
+        :param speed: Recorded ticks shown per rendered frame; arrow keys halve or double it
+        """
+        frame = 0.0
+        running = True
+        while running and int(frame) < len(replay):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT:
+                    speed *= 2
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT:
+                    speed /= 2
+                else:
+                    self.handle_event(event)
+            self.draw_graph(replay.graph_at(int(frame)))
+            self.renderer.present()
+            frame += speed
+            self.clock.tick(FRAMERATE_DEFAULT)
+        pygame.quit()
+
 
 if __name__ == "__main__":
-    n_agents = N_AGENTS
-    graph = AgentGraph()
-    for i in range(n_agents):
-        name = make_name(random.choice([1, 2, 3]))
-        loc = np.random.randint(0, min(WIDTH, HEIGHT), 2)
-        bearing = np.random.rand() * 2 * np.pi
-        agent = Agent(name, loc=loc, bearing=bearing, color=random.choice(COLORS))
-        graph.add_agent(agent)
-    app = App()
-    app.run(graph)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play the trading game, or replay a recorded run.")
+    parser.add_argument("recording", nargs="?", help="directory written by headless.py --record")
+    parser.add_argument("speed", nargs="?", type=float, default=1.0, help="recorded ticks per frame when replaying")
+    parser.add_argument("--agents", type=int, default=N_AGENTS, help="number of agents")
+    parser.add_argument("--world", type=float, nargs=2, metavar=("WIDTH", "HEIGHT"), help="world size (default: the window size)")
+    parser.add_argument("--window", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), default=(WIDTH, HEIGHT), help="window size")
+    parser.add_argument("--decoupled", action="store_true", help="simulate in a background thread")
+    parser.add_argument("--tick-rate", type=float, default=None, help="maximum ticks per second with --decoupled")
+    parser.add_argument("--profile", action="store_true", help="start with the profiling overlay (F3 toggles it)")
+    parser.add_argument("--stats", action="store_true", help="track wealth statistics and show them in the overlay")
+    args = parser.parse_args()
+
+    app = App(*args.window, profile=args.profile)
+    if args.recording is not None:
+        from checkpoint import Replay
+
+        app.replay(Replay(args.recording), speed=args.speed)
+    else:
+        config = SimConfig() if args.world is None else SimConfig(width=args.world[0], height=args.world[1])
+        graph = random_graph(args.agents, config=config)
+        if args.stats:
+            graph.stats = WealthStats(graph.world)
+        if args.decoupled:
+            app.run_decoupled(graph, tick_rate=args.tick_rate)
+        else:
+            app.run(graph)
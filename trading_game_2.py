@@ -58,8 +58,9 @@ class Agent:
 
 # AgentGraph class
 class AgentGraph(nx.Graph):
-    def __init__(self, agents=None):
+    def __init__(self, agents=None, verbose=False):
         super().__init__()
+        self.verbose = verbose  # print every trade to the console
         if agents:
             for agent in agents:
                 self.add_agent(agent)
@@ -90,7 +91,8 @@ class AgentGraph(nx.Graph):
                     if self.trade(agent1, agent2):
                         agent1.trading_with = agent2
                         agent2.trading_with = agent1
-                        print(f"{agent1.name} traded with {agent2.name}")
+                        if self.verbose:
+                            print(f"{agent1.name} traded with {agent2.name}")
                     else:
                         agent1.trading_with = None
                         agent2.trading_with = None
@@ -0,0 +1,330 @@
+"""Streaming statistics of the wealth distribution, updated from each tick's transfers."""
+
+import numpy as np
+
+from world import TopK
+
+
+class DownsampledSeries:
+    """
+    Per-tick rows in a fixed amount of memory.
+
+    Rows are kept every `stride` ticks. When the buffer is full every other row is dropped
+    and the stride doubles, so a run of any length is covered evenly by between half and
+    all of `capacity` rows.
+    """
+
+    def __init__(self, columns, capacity=4096):
+        if capacity < 2 or capacity % 2:
+            raise ValueError("capacity must be an even number of at least 2")
+        self.columns = tuple(columns)
+        self.data = np.zeros((capacity, len(self.columns)))
+        self.length = 0
+        self.stride = 1
+        self.offered = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row):
+        keep = self.offered % self.stride == 0
+        self.offered += 1
+        if not keep:
+            return
+        self.data[self.length] = row
+        self.length += 1
+        if self.length == len(self.data):
+            half = len(self.data) // 2
+            self.data[:half] = self.data[::2]
+            self.length = half
+            self.stride *= 2
+
+    def array(self):
+        """Copy of the kept rows, one column per entry of `columns`."""
+        return self.data[: self.length].copy()
+
+    def column(self, name):
+        return self.data[: self.length, self.columns.index(name)].copy()
+
+    def downsample(self, points):
+        """Average the kept rows into at most `points` rows of consecutive samples."""
+        if self.length <= points:
+            return self.array()
+        starts = np.linspace(0, self.length, points, endpoint=False).astype(np.int64)
+        counts = np.diff(np.r_[starts, self.length])
+        return np.add.reduceat(self.data[: self.length], starts, axis=0) / counts[:, None]
+
+
+def histogram_gini(counts, sums):
+    """
+    Gini coefficient of a population given as bins in increasing order, each holding
+    `counts` agents worth `sums` in total. Exact when every bin holds a single value;
+    otherwise inequality inside a bin is ignored.
+    """
+    n, total = counts.sum(), sums.sum()
+    if n == 0 or total <= 0:
+        return 0.0
+    # the agents of a bin hold ranks before+1 .. before+count in sorted order
+    before = np.cumsum(counts) - counts
+    ranked = (sums * (before + (counts + 1) / 2)).sum()
+    return float(2 * ranked / (n * total) - (n + 1) / n)
+
+
+class WealthStats:
+    """
+    Running statistics of a World's holdings: per-resource and total-wealth histograms,
+    Gini coefficient of wealth, top-k holders, the share of agents holding none of the
+    resource they want, and the mean and variance of every holding.
+
+    Everything is updated from the transfers of each tick, touching only the agents that
+    traded, so the cost per tick does not grow with the population. Agents appended to the
+    world are added as they appear, and any other edit (signalled by World.resources_changed)
+    triggers one full rebuild. Dead slots are not counted.
+
+    Attach it as `graph.stats` to have AgentGraph.do_trades feed it and AgentGraph.spawn and
+    despawn keep it up to date.
+    """
+
+    SERIES_COLUMNS = ("tick", "gini", "zero_want_share", "wealth_mean", "wealth_std", "top_share")
+
+    def __init__(self, world, n_bins=256, bin_width=1, n_wealth_bins=1024, wealth_bin_width=1, k=10, capacity=4096):
+        """
+        :param world: World to observe
+        :param n_bins: Histogram bins per resource; larger holdings share one overflow bin
+        :param bin_width: Units per resource bin
+        :param n_wealth_bins: Histogram bins of total wealth, plus one overflow bin
+        :param wealth_bin_width: Units per wealth bin (1 makes the Gini coefficient exact below the overflow bin)
+        :param k: Number of top holders tracked per resource and for total wealth
+        :param capacity: Maximum rows kept in the time series
+        """
+        self.world = world
+        self.n_resources = world.n_resources
+        self.n_bins = n_bins
+        self.bin_width = bin_width
+        self.n_wealth_bins = n_wealth_bins
+        self.wealth_bin_width = wealth_bin_width
+        self.k = k
+        self.series = DownsampledSeries(self.SERIES_COLUMNS, capacity)
+        self.rebuilds = 0
+        self.rebuild()
+
+    def rebuild(self):
+        """Recompute everything from the world's current holdings."""
+        world, n_resources = self.world, self.n_resources
+        self.size = 0  # slots below this one are accounted for
+        self.count = 0  # living agents accounted for
+        self.version = world.resource_version
+        self.histograms = np.zeros((n_resources, self.n_bins + 1), dtype=np.int64)
+        self.wealth_counts = np.zeros(self.n_wealth_bins + 1, dtype=np.int64)
+        self.wealth_sums = np.zeros(self.n_wealth_bins + 1, dtype=np.int64)
+        self.sums = np.zeros(n_resources, dtype=np.int64)
+        self.squares = np.zeros(n_resources, dtype=np.int64)
+        self.wealth_squares = 0
+        self.zero_want = 0
+        self.top_holders = [TopK(self.k) for _ in range(n_resources)]
+        self.top_wealth = TopK(self.k)
+        self._grow()
+        for r, top in enumerate(self.top_holders):
+            top.rebuild(world.resources[:, r])
+        self.top_wealth.rebuild(world.resources.sum(axis=1))
+        self.rebuilds += 1
+
+    def _account(self, holdings, want, sign):
+        """Add (sign=1) or remove (sign=-1) agents with the given holdings from the aggregates."""
+        n_resources = self.n_resources
+        bins = np.minimum(holdings // self.bin_width, self.n_bins) + np.arange(n_resources) * (self.n_bins + 1)
+        self.histograms += sign * np.bincount(bins.ravel(), minlength=self.histograms.size).reshape(self.histograms.shape)
+        wealth = holdings.sum(axis=1)
+        wealth_bins = np.minimum(wealth // self.wealth_bin_width, self.n_wealth_bins)
+        self.wealth_counts += sign * np.bincount(wealth_bins, minlength=len(self.wealth_counts))
+        self.wealth_sums += sign * np.bincount(wealth_bins, wealth, minlength=len(self.wealth_sums)).astype(np.int64)
+        self.sums += sign * holdings.sum(axis=0)
+        self.squares += sign * (holdings * holdings).sum(axis=0)
+        self.wealth_squares += sign * int((wealth * wealth).sum())
+        self.zero_want += sign * int(np.count_nonzero(holdings[np.arange(len(holdings)), want] == 0))
+        self.count += sign * len(holdings)
+
+    def _grow(self):
+        """Add the agents appended to the world since the last call."""
+        start, stop = self.size, len(self.world)
+        if stop <= start:
+            return
+        self.size = stop
+        added = start + np.flatnonzero(self.world.alive[start:stop])
+        self._account(self.world.resources[added], self.world.want[added], 1)
+        if start:
+            self._update_top(added)
+
+    def _update_top(self, receivers):
+        world = self.world
+        for r, top in enumerate(self.top_holders):
+            top.update(receivers, lambda a, r=r: world.resources[a, r], lambda r=r: world.resources[:, r])
+        self.top_wealth.update(receivers, self._wealth_of, self._wealth)
+
+    def add(self, slots):
+        """Account for agents spawned into `slots`."""
+        # the spawn may have grown the world; _grow accounts for the appended slots
+        start = self.size
+        self._grow()
+        slots = slots[slots < start]
+        self._account(self.world.resources[slots], self.world.want[slots], 1)
+        self._update_top(slots)
+
+    def remove(self, slots, holdings):
+        """
+        Account for agents that were despawned.
+        :param holdings: What they held, as returned by World.despawn
+        """
+        known = slots < self.size
+        self._account(holdings[known], self.world.want[slots[known]], -1)
+        # their holdings are zero now, which drops them from the top lists
+        self._update_top(np.empty(0, dtype=np.int64))
+
+    def _wealth_of(self, agents):
+        return self.world.resources[agents].sum(axis=1)
+
+    def _wealth(self):
+        return self.world.resources.sum(axis=1)
+
+    def record(self, trades, tick=None):
+        """
+        Update with one tick of trades, already applied to the world, and append a row to the series.
+        :param trades: world.Trades returned by World.trade
+        :param tick: Tick number stored in the series (default: the number of recorded ticks)
+        """
+        world = self.world
+        if world.resource_version != self.version or len(world) < self.size:
+            self.rebuild()
+        else:
+            if len(trades.amount):
+                self._transfer(trades)
+            self._grow()
+        if tick is None:
+            tick = self.series.offered
+        self.series.append(self.row(tick))
+
+    def _transfer(self, trades):
+        world, n_resources = self.world, self.n_resources
+        agents = np.concatenate((trades.giver, trades.receiver)).astype(np.int64)
+        touched, inverse = np.unique(agents, return_inverse=True)
+        amount = trades.amount.astype(np.int64)
+        # holdings before the trades, rebuilt from the net change of every touched agent
+        change = np.bincount(
+            inverse * n_resources + np.concatenate((trades.resource, trades.resource)),
+            np.concatenate((-amount, amount)),
+            minlength=len(touched) * n_resources,
+        ).reshape(-1, n_resources)
+        # agents appended since the last tick are added by _grow with their current holdings
+        old = touched < self.size
+        touched, change = touched[old], change[old].astype(np.int64)
+        after = world.resources[touched]
+        want = world.want[touched]
+        self._account(after - change, want, -1)
+        self._account(after, want, 1)
+
+        receiver, resource = trades.receiver.astype(np.int64), trades.resource
+        receiver, resource = receiver[receiver < self.size], resource[receiver < self.size]
+        for r, top in enumerate(self.top_holders):
+            top.update(receiver[resource == r], lambda a, r=r: world.resources[a, r], lambda r=r: world.resources[:, r])
+        self.top_wealth.update(touched, self._wealth_of, self._wealth)
+
+    # queries
+
+    def mean(self):
+        """Mean holding of every resource."""
+        return self.sums / self.count if self.count else np.zeros(self.n_resources)
+
+    def std(self):
+        """Standard deviation of every resource's holdings."""
+        if not self.count:
+            return np.zeros(self.n_resources)
+        mean = self.sums / self.count
+        return np.sqrt(np.maximum(self.squares / self.count - mean * mean, 0.0))
+
+    def wealth_mean(self):
+        return float(self.sums.sum() / self.count) if self.count else 0.0
+
+    def wealth_std(self):
+        if not self.count:
+            return 0.0
+        mean = self.sums.sum() / self.count
+        return float(np.sqrt(max(self.wealth_squares / self.count - mean * mean, 0.0)))
+
+    def gini(self):
+        """Gini coefficient of total wealth, from the wealth histogram."""
+        return histogram_gini(self.wealth_counts, self.wealth_sums)
+
+    def zero_want_share(self):
+        """Fraction of agents holding none of the resource they want."""
+        return self.zero_want / self.count if self.count else 0.0
+
+    def top(self, resource=None):
+        """
+        Largest holders, largest first.
+        :param resource: Resource index, or None for total wealth
+        :return: (agents, amounts)
+        """
+        return (self.top_wealth if resource is None else self.top_holders[resource]).top()
+
+    def top_share(self):
+        """Share of all wealth held by the k richest agents."""
+        total = self.sums.sum()
+        return float(self.top()[1].sum() / total) if total > 0 else 0.0
+
+    def histogram(self, resource=None):
+        """
+        Current histogram of one resource, or of total wealth.
+        :return: (edges, counts): counts[b] agents hold from edges[b] up to edges[b + 1];
+            the last bin is open-ended and has edges[-1] == inf
+        """
+        if resource is None:
+            counts, width = self.wealth_counts, self.wealth_bin_width
+        else:
+            counts, width = self.histograms[resource], self.bin_width
+        edges = np.r_[np.arange(len(counts)) * width, np.inf]
+        return edges, counts.copy()
+
+    def row(self, tick):
+        return (tick, self.gini(), self.zero_want_share(), self.wealth_mean(), self.wealth_std(), self.top_share())
+
+    def summary(self):
+        """Headline numbers as a dict."""
+        agents, wealth = self.top()
+        return {
+            "agents": self.count,
+            "gini": self.gini(),
+            "zero_want_share": self.zero_want_share(),
+            "mean": self.mean().tolist(),
+            "std": self.std().tolist(),
+            "wealth_mean": self.wealth_mean(),
+            "wealth_std": self.wealth_std(),
+            "top_wealth": [(int(a), int(w)) for a, w in zip(agents, wealth)],
+            "top_share": self.top_share(),
+            "rebuilds": self.rebuilds,
+        }
+
+    def report_lines(self, resource_names=None):
+        """Human-readable summary for overlays and logs."""
+        if resource_names is None:
+            resource_names = [str(r) for r in range(self.n_resources)]
+        lines = [
+            f"gini {self.gini():.3f}  zero-want {self.zero_want_share():6.1%}  top{self.k} share {self.top_share():6.1%}",
+            f"wealth {self.wealth_mean():.1f} +- {self.wealth_std():.1f}",
+        ]
+        for r, (name, mean, std) in enumerate(zip(resource_names, self.mean(), self.std())):
+            agents, amounts = self.top(r)
+            best = f"max {amounts[0]} (agent {agents[0]})" if len(agents) else ""
+            lines.append(f"{name:6s} {mean:7.2f} +- {std:6.2f}  {best}")
+        return lines
+
+    def save(self, path):
+        """Write the time series and the current histograms to an .npz file."""
+        np.savez(
+            path,
+            columns=np.array(self.series.columns),
+            series=self.series.array(),
+            stride=self.series.stride,
+            histograms=self.histograms,
+            wealth_counts=self.wealth_counts,
+            wealth_sums=self.wealth_sums,
+        )
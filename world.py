@@ -0,0 +1,545 @@
+from collections import Counter
+from itertools import compress
+from typing import NamedTuple
+
+import numpy as np
+
+TOP_CANDIDATES = 8  # runners-up kept per resource for max_holding
+
+
+class Trades(NamedTuple):
+    """Outcome of one tick of trading."""
+
+    i: np.ndarray  # first agent of each pair that traded
+    j: np.ndarray  # second agent of each pair that traded
+    giver: np.ndarray  # one entry per transfer
+    receiver: np.ndarray
+    resource: np.ndarray
+    amount: np.ndarray
+
+
+def _mix64(x):
+    """SplitMix64 finalizer: a bijective scramble of uint64 values."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def counter_uniform(key, tick, ids, stream):
+    """
+    Uniform [0, 1) numbers that depend only on (key, tick, agent id, stream).
+
+    Unlike a sequential generator, the value for one agent does not depend on how many other
+    agents were drawn before it, so any subset of agents can be advanced on its own.
+    """
+    base = _mix64(np.array([key, tick * 4 + stream], dtype=np.uint64))
+    x = _mix64(np.asarray(ids, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15) + base[0])
+    x = _mix64(x ^ base[1])
+    return (x >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+class TopK:
+    """
+    The k largest values of a column of which only a few entries change per tick.
+
+    Up to `slack * k` candidates are kept sorted, together with `floor`, an upper bound on the
+    value of every agent that is not a candidate. Values only rise through receiving, so after
+    each tick only the candidates and the receivers above the floor need to be looked at; the
+    column is scanned again only when the k-th candidate drops below the floor.
+    """
+
+    def __init__(self, k, slack=4):
+        """
+        :param k: Number of top entries reported
+        :param slack: Candidates kept per reported entry
+        """
+        self.k = k
+        self.size = max(k * slack, k)
+        self.agents = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.int64)
+        self.floor = -np.inf
+        self.rescans = 0
+
+    def _keep(self, agents, values):
+        # largest first, ties by agent id
+        order = np.lexsort((agents, -values))
+        self.agents, self.values = agents[order[: self.size]], values[order[: self.size]]
+        return values[order[self.size :]]
+
+    def rebuild(self, values):
+        """Pick the candidates from a full column."""
+        self.rescans += 1
+        n = len(values)
+        if n > self.size:
+            cut = np.argpartition(values, n - self.size - 1)
+            self.floor = values[cut[n - self.size - 1]]
+            inside = cut[n - self.size :]
+        else:
+            self.floor = -np.inf
+            inside = np.arange(n)
+        self._keep(inside.astype(np.int64), values[inside])
+
+    def update(self, receivers, value_of, column):
+        """
+        Account for one tick of changes.
+        :param receivers: Agents whose value may have grown
+        :param value_of: Callable returning the current values of an array of agents
+        :param column: Callable returning the full current column, used for a rescan
+        """
+        receivers = receivers[value_of(receivers) > self.floor]
+        agents = np.union1d(self.agents, receivers)
+        evicted = self._keep(agents, value_of(agents))
+        if len(evicted):
+            self.floor = max(self.floor, evicted.max())
+        kth = self.values[self.k - 1] if len(self.values) >= self.k else -np.inf
+        if kth < self.floor:
+            self.rebuild(column())
+
+    def discard(self, agents):
+        """Drop agents that no longer exist from the candidates; call update afterwards."""
+        keep = ~np.isin(self.agents, agents)
+        self.agents, self.values = self.agents[keep], self.values[keep]
+
+    def top(self):
+        """(agents, values) of the k largest entries, largest first."""
+        return self.agents[: self.k], self.values[: self.k]
+
+
+class World:
+    """
+    Struct-of-arrays store for agent state.
+
+    Every per-agent quantity lives in one contiguous array indexed by agent slot, so a tick
+    advances the whole population with a handful of vectorized operations instead of a
+    Python loop over agent objects.
+
+    Agents keep their slot for life. Despawned slots are marked dead in the `alive` mask and
+    pushed on a free list that spawn() pops before growing the arrays, so the population can
+    change every tick at a constant cost per agent. Each agent also gets a `uid` that is
+    never reused; slot_of() maps uids back to slots. `names_in_use` counts the names of the
+    living agents, so new names can be checked against it without a pass over the population.
+    """
+
+    # field name -> (dtype, per-agent shape, fill value for new slots)
+    FIELDS = {
+        "loc": (np.float64, (2,), 0.0),
+        "bearing": (np.float64, (), 0.0),
+        "steprate": (np.float64, (), 0.0),
+        "stepsize": (np.float64, (), 0.0),
+        "turn_variance": (np.float64, (), 0.0),
+        "want": (np.int8, (), 0),
+        "color": (np.uint8, (3,), 0),
+        "trading_with": (np.int64, (), -1),
+        "alive": (np.bool_, (), True),
+        "uid": (np.int64, (), -1),
+    }
+
+    def __init__(self, width, height, torus=True, n_resources=3, capacity=16, seed=None):
+        """
+        :param width: World width
+        :param height: World height
+        :param torus: Wrap positions around the edges instead of clipping them
+        :param n_resources: Number of resource types held by each agent
+        :param capacity: Initial number of preallocated agent slots
+        :param seed: Seed (or np.random.Generator) for the per-tick random draws
+        """
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.n_resources = n_resources
+        self.rng = np.random.default_rng(seed)
+        self.size = 0
+        self.names = []
+        self.names_in_use = Counter()  # name -> number of living agents with it
+        self.debug = False  # cross-check the running aggregates after every trade
+        self.noise_key = None  # set by use_counter_noise()
+        self.resource_version = 0  # bumped by resources_changed, so observers can tell they missed an edit
+        self.population_version = 0  # bumped whenever agents are added or removed
+        self.next_uid = 0
+        self._free = np.empty(0, dtype=np.int64)  # stack of dead slots
+        self.n_free = 0
+        self._slots = np.empty(0, dtype=np.int64)  # uid -> slot, -1 once despawned
+        self._buffers = {}
+        self._fields = dict(self.FIELDS, resources=(np.int64, (n_resources,), 0))
+        self._allocate(max(capacity, 1))
+        self._recompute_aggregates()
+
+    def __len__(self):
+        """Number of slots in use, dead ones included (see n_alive)."""
+        return self.size
+
+    @property
+    def n_alive(self):
+        return self.size - self.n_free
+
+    def live(self):
+        """Slots of the living agents, in increasing order."""
+        if self.n_free == 0:
+            return np.arange(self.size)
+        return np.flatnonzero(self._buffers["alive"][: self.size])
+
+    def __getattr__(self, field):
+        # expose the live part of each buffer, e.g. world.loc is an (size, 2) view
+        buffers = self.__dict__.get("_buffers")
+        if buffers is not None and field in buffers:
+            return buffers[field][: self.size]
+        raise AttributeError(field)
+
+    @property
+    def capacity(self):
+        return len(self._buffers["loc"])
+
+    @property
+    def bounds(self):
+        return np.array([self.width, self.height], dtype=np.float64)
+
+    def _allocate(self, capacity):
+        """Resize every buffer to hold `capacity` agents, keeping existing data."""
+        for field, (dtype, shape, fill) in self._fields.items():
+            buffer = np.full((capacity,) + shape, fill, dtype=dtype)
+            old = self._buffers.get(field)
+            if old is not None:
+                buffer[: self.size] = old[: self.size]
+            self._buffers[field] = buffer
+
+    def reserve(self, n):
+        """Make room for `n` more agents, growing geometrically."""
+        needed = self.size + n
+        if needed > self.capacity:
+            self._allocate(max(needed, 2 * self.capacity))
+
+    def extend(self, names, **fields):
+        """
+        Append a batch of agents.
+        :param names: List of agent names
+        :param fields: Arrays (or scalars) for any of the per-agent fields
+        :return: Slice of the new agent slots
+        """
+        n = len(names)
+        self.reserve(n)
+        start, stop = self.size, self.size + n
+        for field, values in fields.items():
+            if field not in self._fields:
+                raise KeyError(f"unknown agent field {field!r}")
+            self._buffers[field][start:stop] = values
+        self.names.extend(names)
+        self.names_in_use.update(names)
+        self.size = stop
+        self._register(np.arange(start, stop))
+        return slice(start, stop)
+
+    def spawn(self, names, **fields):
+        """
+        Add a batch of agents, reusing dead slots before growing the arrays.
+        :param names: List of agent names
+        :param fields: Arrays (or scalars) for any of the per-agent fields; fields left out
+            get their default value
+        :return: Array of the new agents' slots
+        """
+        n = len(names)
+        reused = min(n, self.n_free)
+        self.n_free -= reused
+        slots = np.concatenate((self._free[self.n_free : self.n_free + reused], np.arange(self.size, self.size + n - reused)))
+        self.reserve(n - reused)
+        self.names.extend([""] * (n - reused))
+        self.size += n - reused
+        for field, (dtype, shape, fill) in self._fields.items():
+            self._buffers[field][slots] = fields.pop(field, fill)
+        if fields:
+            raise KeyError(f"unknown agent fields {sorted(fields)}")
+        names_list = self.names
+        for slot, name in zip(slots.tolist(), names):
+            names_list[slot] = name
+        self.names_in_use.update(names)
+        self._register(slots)
+        return slots
+
+    def despawn(self, slots):
+        """
+        Remove the agents at `slots`; their resources leave the world and the slots are reused by spawn().
+        Pairs and trades computed before the call may still mention the removed slots.
+        :return: (slots, resources): the removed slots, sorted, and what they held
+        """
+        slots = np.unique(np.asarray(slots, dtype=np.int64))
+        b = self._buffers
+        if len(slots) and (slots[-1] >= self.size or not b["alive"][slots].all()):
+            raise ValueError("can only despawn living agents")
+        b["alive"][slots] = False
+        b["steprate"][slots] = 0.0  # dead agents never move, whatever the noise
+        b["trading_with"][slots] = -1
+        self._slots[b["uid"][slots]] = -1
+        in_use = self.names_in_use
+        for name in map(self.names.__getitem__, slots.tolist()):
+            if in_use[name] > 1:
+                in_use[name] -= 1
+            else:
+                del in_use[name]
+        removed = b["resources"][slots]
+        b["resources"][slots] = 0
+        if self._aggregates_valid:
+            self._totals = self._totals - removed.sum(axis=0)
+            for r, top in enumerate(self._top):
+                top.discard(slots)
+            self._update_top(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        if self.n_free + len(slots) > len(self._free):
+            self._free = np.concatenate((self._free[: self.n_free], np.empty(max(len(slots), self.n_free), dtype=np.int64)))
+        self._free[self.n_free : self.n_free + len(slots)] = slots
+        self.n_free += len(slots)
+        self.population_version += 1
+        return slots, removed
+
+    def _register(self, slots):
+        """Give fresh uids to new agents and account for them in the aggregates."""
+        uids = np.arange(self.next_uid, self.next_uid + len(slots))
+        self.next_uid += len(slots)
+        self._buffers["uid"][slots] = uids
+        self._buffers["alive"][slots] = True
+        if len(self._slots) < self.next_uid:
+            self._slots = np.concatenate((self._slots, np.full(max(self.next_uid - len(self._slots), len(self._slots)), -1)))
+        self._slots[uids] = slots
+        self.population_version += 1
+        if self._aggregates_valid:
+            self._track_new(slots)
+
+    def slot_of(self, uid):
+        """Current slot of the agents with the given uids (-1 for despawned ones)."""
+        uid = np.asarray(uid, dtype=np.int64)
+        known = (uid >= 0) & (uid < len(self._slots))
+        slots = np.full(uid.shape, -1, dtype=np.int64)
+        slots[known] = self._slots[uid[known]]
+        return slots
+
+    def add(self, name, **fields):
+        """Add a single agent, in a free slot if there is one, and return its slot."""
+        return int(self.spawn([name], **fields)[0])
+
+    def copy_from(self, other, index):
+        """Add a copy of slot `index` of another world and return the new slot."""
+        fields = {field: other._buffers[field][index] for field in self._fields if field != "uid"}
+        return self.add(other.names[index], **fields)
+
+    def arrays(self):
+        """Live per-agent arrays keyed by field name."""
+        return {field: self._buffers[field][: self.size] for field in self._fields}
+
+    def load_arrays(self, names, arrays):
+        """
+        Replace the whole population. The arrays are used as buffers directly, so
+        memory-mapped arrays stay memory-mapped until the world has to grow.
+        :param names: List of agent names
+        :param arrays: Dict with one array per field, as returned by arrays()
+        """
+        for field in self._fields:
+            if len(arrays[field]) != len(names):
+                raise ValueError(f"field {field!r} has {len(arrays[field])} rows for {len(names)} agents")
+        self._buffers = {field: arrays[field] for field in self._fields}
+        self.names = list(names)
+        self.size = len(names)
+        alive, uid = self._buffers["alive"], self._buffers["uid"]
+        self.names_in_use = Counter(compress(self.names, alive))
+        self._free = np.flatnonzero(~alive)
+        self.n_free = len(self._free)
+        self.next_uid = int(uid.max(initial=-1)) + 1
+        self._slots = np.full(self.next_uid, -1, dtype=np.int64)
+        self._slots[uid[alive]] = np.flatnonzero(alive)
+        self.population_version += 1
+        self.resources_changed()
+
+    def resources_changed(self):
+        """Call after writing to the resource matrix directly; aggregates are rebuilt on demand."""
+        self._aggregates_valid = False
+        self.resource_version += 1
+
+    @property
+    def totals(self):
+        """Total amount of each resource across all agents."""
+        if not self._aggregates_valid:
+            self._recompute_aggregates()
+        return self._totals
+
+    def max_holding(self):
+        """Return (agent, amount) arrays with the largest holder of each resource (-1 if empty)."""
+        if not self._aggregates_valid:
+            self._recompute_aggregates()
+        return self._max_holder, self._max_amount
+
+    def _holdings(self, r):
+        """Column r of the resource matrix with the dead slots at -1, so they never lead."""
+        column = self._buffers["resources"][: self.size, r]
+        return np.where(self._buffers["alive"][: self.size], column, -1) if self.n_free else column
+
+    def _recompute_aggregates(self):
+        resources = self._buffers["resources"][: self.size]
+        self._totals = resources.sum(axis=0)
+        # a few runners-up per resource, so losing the top holder rarely needs a rescan
+        self._top = [TopK(1, slack=TOP_CANDIDATES) for _ in range(self.n_resources)]
+        for r, top in enumerate(self._top):
+            top.rebuild(self._holdings(r))
+        self._max_holder = np.full(self.n_resources, -1, dtype=np.int64)
+        self._max_amount = np.zeros(self.n_resources, dtype=resources.dtype)
+        self._aggregates_valid = True
+        self._update_top(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    def _update_top(self, receiver, resource):
+        """Refresh the top holders after `receiver` gained `resource` (givers are candidates or below the floor)."""
+        resources = self._buffers["resources"]
+        for r, top in enumerate(self._top):
+            top.update(receiver[resource == r], lambda a, r=r: resources[a, r], lambda r=r: self._holdings(r))
+            agents, values = top.top()
+            self._max_holder[r] = agents[0] if len(agents) else -1
+            self._max_amount[r] = values[0] if len(values) else 0
+
+    def _track_new(self, slots):
+        if len(slots) == 0:
+            return
+        if 4 * len(slots) > self.size:
+            # a batch this large, e.g. the starting population, is quicker to rescan
+            self._recompute_aggregates()
+            return
+        self._totals = self._totals + self._buffers["resources"][slots].sum(axis=0)
+        n = self.n_resources
+        self._update_top(np.repeat(slots, n), np.tile(np.arange(n), len(slots)))
+
+    def _track_transfers(self, giver, receiver, resource):
+        """Update the running maxima after a batch of transfers (totals do not change)."""
+        self._update_top(receiver, resource)
+
+    def verify_aggregates(self):
+        """Compare the running aggregates with a full recompute and raise on any mismatch."""
+        if not self._aggregates_valid:
+            return
+        resources = self._buffers["resources"][: self.size]
+        if not np.array_equal(self._totals, resources.sum(axis=0)):
+            raise RuntimeError(f"resource totals drifted: {self._totals} != {resources.sum(axis=0)}")
+        if self.size:
+            best = resources.max(axis=0)
+            held = resources[self._max_holder, np.arange(self.n_resources)]
+            if not (np.array_equal(best, self._max_amount) and np.array_equal(held, best)):
+                raise RuntimeError(f"top holdings drifted: {self._max_amount} != {best}")
+
+    def wrap(self, loc):
+        """Map positions back into the world, wrapping on a torus or clipping otherwise."""
+        if self.torus:
+            return np.mod(loc, self.bounds)
+        return np.clip(loc, 0, self.bounds)
+
+    def displacement(self, src, dst):
+        """Shortest vector from `src` to `dst`, taking the wraparound into account."""
+        delta = dst - src
+        if self.torus:
+            delta = delta - self.bounds * np.round(delta / self.bounds)
+        return delta
+
+    def move(self, index, delta):
+        """Displace the agents at `index` by `delta`."""
+        loc = self._buffers["loc"]
+        loc[index] = self.wrap(loc[index] + delta)
+
+    def use_counter_noise(self, key=None):
+        """
+        Draw the random-walk noise from counter_uniform instead of self.rng.
+
+        Each agent's noise then depends only on the key, the tick and the agent's id, so
+        a run split across processes reproduces a single-process run exactly.
+        :param key: 63-bit noise key (default: drawn from self.rng)
+        """
+        self.noise_key = int(self.rng.integers(2**63)) if key is None else int(key)
+
+    def step(self, tick=0, ids=None):
+        """
+        Advance every agent by one random-walk step.
+        :param tick: Tick number, used by counter noise only
+        :param ids: Agent ids for counter noise (default: the slot indices)
+        """
+        n = self.size
+        b = self._buffers
+        if self.noise_key is None:
+            moving = np.flatnonzero(self.rng.random(n) < b["steprate"][:n])
+            normal = self.rng.standard_normal(moving.size)
+        else:
+            ids = np.arange(n) if ids is None else ids
+            moving = np.flatnonzero(counter_uniform(self.noise_key, tick, ids, 0) < b["steprate"][:n])
+            # Box-Muller from two more independent streams
+            u1 = counter_uniform(self.noise_key, tick, ids[moving], 1)
+            u2 = counter_uniform(self.noise_key, tick, ids[moving], 2)
+            normal = np.sqrt(-2 * np.log1p(-u1)) * np.cos(2 * np.pi * u2)
+        b["bearing"][moving] += normal * b["turn_variance"][moving]
+        bearing = b["bearing"][moving]
+        delta = np.column_stack((np.cos(bearing), np.sin(bearing))) * b["stepsize"][moving, None]
+        b["loc"][moving] = self.wrap(b["loc"][moving] + delta)
+
+    def trade(self, i, j, dist, units=1):
+        """
+        Resolve all trades of one tick in bulk.
+
+        Every pair of agents with different wants trades both ways: each side asks the other
+        for up to `units` of the resource it wants. Requests are served against the giver's
+        stock at the start of the tick, nearest partner first (ties broken by index), so an
+        agent trading with several partners can never go negative. Agents that traded then
+        move halfway toward the mean position of their partners.
+        :param i: First agent of each candidate pair
+        :param j: Second agent of each candidate pair
+        :param dist: Distance between the agents of each pair
+        :param units: Maximum amount handed over per request
+        :return: Trades
+        """
+        n = self.size
+        b = self._buffers
+        want = b["want"][:n]
+        resources = b["resources"][:n]
+        keep = want[i] != want[j]
+        i, j, dist = i[keep], j[keep], dist[keep]
+
+        # every pair makes two requests: i asks j for want[i] and j asks i for want[j]
+        pair = np.tile(np.arange(len(i)), 2)
+        receiver = np.concatenate((i, j))
+        giver = np.concatenate((j, i))
+        resource = want[receiver].astype(np.int64)
+        order = np.lexsort((receiver, np.tile(dist, 2), resource, giver))
+        pair, receiver, giver, resource = pair[order], receiver[order], giver[order], resource[order]
+
+        # serve each (giver, resource) queue in order until the stock runs out
+        key = giver * self.n_resources + resource
+        first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        rank = np.arange(len(key)) - np.repeat(first, np.diff(np.r_[first, len(key)]))
+        amount = np.clip(resources[giver, resource] - rank * units, 0, units)
+
+        moved = amount > 0
+        pair, giver, receiver, resource, amount = pair[moved], giver[moved], receiver[moved], resource[moved], amount[moved]
+        flat = resources.reshape(-1)
+        flat -= np.bincount(giver * self.n_resources + resource, amount, minlength=flat.size).astype(flat.dtype)
+        flat += np.bincount(receiver * self.n_resources + resource, amount, minlength=flat.size).astype(flat.dtype)
+        if self._aggregates_valid:
+            self._track_transfers(giver, receiver, resource)
+            if self.debug:
+                self.verify_aggregates()
+
+        traded = np.zeros(len(i), dtype=bool)
+        traded[pair] = True
+        i, j, dist = i[traded], j[traded], dist[traded]
+        self._move_toward_partners(i, j, dist)
+        return Trades(i, j, giver, receiver, resource, amount)
+
+    def _move_toward_partners(self, i, j, dist):
+        """Move every agent in the pairs halfway toward the mean position of its partners."""
+        loc = self._buffers["loc"]
+        trading_with = self._buffers["trading_with"]
+        trading_with[: self.size] = -1
+        if len(i) == 0:
+            return
+        agent = np.concatenate((i, j))
+        partner = np.concatenate((j, i))
+        order = np.lexsort((partner, np.tile(dist, 2), agent))
+        agent, partner = agent[order], partner[order]
+        first = np.flatnonzero(np.r_[True, agent[1:] != agent[:-1]])
+        movers = agent[first]
+        trading_with[movers] = partner[first]  # nearest partner
+
+        # sum per agent over a fixed (agent, distance, partner) order so results do not
+        # depend on how the pairs were found
+        offset = self.displacement(loc[agent], loc[partner])
+        counts = np.diff(np.r_[first, len(agent)])
+        mean = np.add.reduceat(offset, first, axis=0) / counts[:, None]
+        loc[movers] = self.wrap(loc[movers] + mean / 2)